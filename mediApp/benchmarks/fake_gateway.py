@@ -0,0 +1,165 @@
+"""Local stand-in for the Medicover login host and API gateway.
+
+Serves just enough of /connect/authorize, the login form, /connect/token,
+search-appointments/slots and search-appointments/filters for the benchmarks
+to exercise the real client code, plus a Gotify-style /message endpoint for
+notification dispatch. Slot pages are generated on the fly.
+
+Run on its own with:  python benchmarks/fake_gateway.py --port 8080 --slots 5000
+"""
+import argparse
+import datetime
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+OIDC_REDIRECT = "https://online24.medicover.pl/signin-oidc"
+LOGIN_PAGE = """<html><body><form method="post">
+<input name="__RequestVerificationToken" type="hidden" value="fake-csrf-token" />
+</form></body></html>"""
+
+
+class GatewayConfig:
+    def __init__(self, slots=5000, doctors=40, clinics=8, full_login=False, latency=0.0):
+        self.slots = slots
+        self.doctors = doctors
+        self.clinics = clinics
+        self.full_login = full_login
+        self.latency = latency
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def hit(self, path):
+        with self.lock:
+            self.counts[path] = self.counts.get(path, 0) + 1
+
+
+def make_slot(index, start, config):
+    """Slot number `index`, four slots per doctor-day, in chronological order."""
+    when = start + datetime.timedelta(minutes=15 * index)
+    doctor = index % config.doctors
+    clinic = doctor % config.clinics
+    return {
+        "appointmentDate": when.strftime("%Y-%m-%dT%H:%M:%S"),
+        "clinic": {"id": 1000 + clinic, "name": f"Clinic {clinic}"},
+        "doctor": {"id": 5000 + doctor, "name": f"Doctor {doctor}"},
+        "specialty": {"id": 4798, "name": "Ginekolog"},
+        "doctorLanguages": [{"id": 4, "name": "Polski"}],
+        "visitType": "Center",
+    }
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    config = GatewayConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, body, status=200):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def redirect(self, location):
+        self.send_response(302)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        self.config.hit(url.path)
+        if self.config.latency:
+            threading.Event().wait(self.config.latency)
+
+        if url.path == "/connect/authorize":
+            if self.config.full_login:
+                self.redirect(f"http://{self.headers['Host']}/Account/Login")
+            else:
+                self.redirect(f"{OIDC_REDIRECT}?code=fake-code")
+        elif url.path == "/Account/Login":
+            payload = LOGIN_PAGE.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        elif url.path == "/connect/authorize/callback":
+            self.redirect(f"{OIDC_REDIRECT}?code=fake-code")
+        elif url.path.endswith("/search-appointments/slots"):
+            self.slots(query)
+        elif url.path.endswith("/search-appointments/filters"):
+            self.filters()
+        else:
+            self.send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        self.config.hit(url.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+
+        if url.path == "/connect/token":
+            self.send_json({
+                "access_token": "fake-access-token",
+                "refresh_token": "fake-refresh-token",
+                "expires_in": 3600,
+                "token_type": "Bearer",
+            })
+        elif url.path == "/Account/Login":
+            self.redirect("/connect/authorize/callback")
+        elif url.path == "/message":
+            self.send_json({"id": 1})
+        else:
+            self.send_json({"error": "not found"}, 404)
+
+    def slots(self, query):
+        page = int(query.get("Page", ["1"])[0])
+        page_size = int(query.get("PageSize", ["5000"])[0])
+        start = datetime.datetime.fromisoformat(query.get("StartTime", [datetime.date.today().isoformat()])[0])
+        start = datetime.datetime.combine(start.date(), datetime.time(8, 0))
+        first = (page - 1) * page_size
+        last = min(first + page_size, self.config.slots)
+        items = [make_slot(index, start, self.config) for index in range(first, last)]
+        self.send_json({"items": items, "page": page, "pageSize": page_size, "totalCount": self.config.slots})
+
+    def filters(self):
+        self.send_json({
+            "regions": [{"id": 202, "value": "Kraków"}, {"id": 204, "value": "Warszawa"}],
+            "specialties": [{"id": 4798, "value": "Ginekolog"}, {"id": 3, "value": "Dermatolog"}],
+            "doctors": [{"id": 5000 + i, "value": f"Doctor {i}"} for i in range(self.config.doctors)],
+            "clinics": [{"id": 1000 + i, "value": f"Clinic {i}"} for i in range(self.config.clinics)],
+        })
+
+
+def start_gateway(config, port=0):
+    """Start the fake gateway in a background thread. Returns (server, base_url)."""
+    handler = type("ConfiguredGatewayHandler", (GatewayHandler,), {"config": config})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-gateway", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the fake Medicover gateway.")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--slots", type=int, default=5000, help="Total slots returned by the slots endpoint")
+    parser.add_argument("--doctors", type=int, default=40)
+    parser.add_argument("--full-login", action="store_true", help="Serve the login form instead of an immediate code")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every GET")
+    args = parser.parse_args()
+
+    server, base_url = start_gateway(
+        GatewayConfig(args.slots, args.doctors, full_login=args.full_login, latency=args.latency), args.port,
+    )
+    print(f"Fake gateway listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,196 @@
+"""Offline benchmarks for the hot paths of mediczuwacz.
+
+Everything runs against benchmarks/fake_gateway.py on localhost, so no
+Medicover account or network access is needed:
+
+    python benchmarks/run_benchmarks.py --slots 5000 --repeat 20
+    python benchmarks/run_benchmarks.py --save before.json
+    python benchmarks/run_benchmarks.py --baseline before.json
+
+Each benchmark reports throughput and p50/p90/p99 latency. With --baseline,
+benchmarks whose p50 got slower than --tolerance are flagged and the script
+exits with status 1.
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_gateway import GatewayConfig, start_gateway  # noqa: E402
+
+import mediczuwacz  # noqa: E402
+from medihunter_notifiers import NotificationQueue  # noqa: E402
+from metrics import percentile  # noqa: E402
+from reminder_store import ReminderStore  # noqa: E402
+from slots import group_by_day, within_reminder_limit  # noqa: E402
+
+
+def measure(name, func, repeat, items=1):
+    """Run func `repeat` times and return a result row; `items` is the work done per call."""
+    func()  # warm-up: imports, connection pool, caches
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - started)
+    durations.sort()
+    total = sum(durations)
+    return {
+        "name": name,
+        "repeat": repeat,
+        "items_per_s": items * repeat / total if total else 0.0,
+        "p50_ms": percentile(durations, 0.5) * 1000,
+        "p90_ms": percentile(durations, 0.9) * 1000,
+        "p99_ms": percentile(durations, 0.99) * 1000,
+    }
+
+
+def authenticator(base_url):
+    class LocalAuthenticator(mediczuwacz.Authenticator):
+        login_url = base_url
+
+    return LocalAuthenticator("bench", "bench", user_agent="mediczuwacz-benchmark")
+
+
+def finder_for(base_url, auth, page_size):
+    class LocalFinder(mediczuwacz.AppointmentFinder):
+        api_url = base_url
+
+    return LocalFinder(auth.session, auth.headers, page_size=page_size)
+
+
+def run(args):
+    config = GatewayConfig(slots=args.slots, doctors=args.doctors, full_login=args.full_login)
+    server, base_url = start_gateway(config)
+    workdir = tempfile.mkdtemp(prefix="mediczuwacz-bench-")
+    results = []
+    try:
+        auth = authenticator(base_url)
+        results.append(measure("login", auth.full_login, args.repeat))
+
+        finder = finder_for(base_url, auth, args.page_size)
+        start = datetime.date.today()
+
+        def find_all():
+            return finder.find_appointments(202, 4798, None, start, None, None, 0)
+
+        appointments = find_all()
+        results.append(measure("find_appointments", find_all, args.repeat, len(appointments)))
+
+        window_end = start + datetime.timedelta(days=args.window_days)
+        windowed = len(finder.find_appointments(202, 4798, None, start, window_end, None, 0))
+        results.append(measure(
+            f"find_appointments_{args.window_days}d",
+            lambda: finder.find_appointments(202, 4798, None, start, window_end, None, 0),
+            args.repeat, windowed,
+        ))
+
+        finder.stream = True
+        results.append(measure(
+            f"stream_appointments_{args.window_days}d",
+            lambda: finder.find_appointments(202, 4798, None, start, window_end, None, 0),
+            args.repeat, windowed,
+        ))
+        finder.stream = False
+
+        def reminder_filter():
+            # Start from an empty store every time, so each repetition bumps the same counts
+            path = os.path.join(workdir, "doctor_data.json")
+            for stale in (path, os.path.join(workdir, "doctor_data.log")):
+                if os.path.exists(stale):
+                    os.remove(stale)
+            store = ReminderStore(path, compact_every=10 ** 9)
+            filtered = list(within_reminder_limit(appointments, store, "bench"))
+            store.flush()
+            store.close()
+            return filtered
+
+        results.append(measure("reminder_filter", reminder_filter, args.repeat, len(appointments)))
+
+        grouped = group_by_day(appointments)
+        results.append(measure(
+            "format_appointments",
+            lambda: mediczuwacz.Notifier.format_appointments(appointments, 3, grouped),
+            args.repeat, len(appointments),
+        ))
+        results.append(measure(
+            "group_and_format",
+            lambda: mediczuwacz.Notifier.format_appointments(appointments, 3),
+            args.repeat, len(appointments),
+        ))
+
+        os.environ["GOTIFY_HOST"] = base_url
+        os.environ["GOTIFY_TOKEN"] = "bench"
+        message = mediczuwacz.Notifier.format_appointments(appointments[:50], 3)
+
+        def dispatch():
+            dispatcher = NotificationQueue(max_retries=0)
+            for i in range(args.messages):
+                dispatcher.add("gotify", message, f"Row {i}")
+            dispatcher.close()
+
+        results.append(measure("notification_dispatch", dispatch, args.repeat, args.messages))
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results, config.counts
+
+
+def print_results(results, baseline=None, tolerance=0.2):
+    regressions = []
+    print(f"{'benchmark':<28} {'items/s':>12} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9}  vs baseline")
+    for row in results:
+        note = ""
+        if baseline and row["name"] in baseline:
+            before = baseline[row["name"]]["p50_ms"]
+            change = (row["p50_ms"] - before) / before if before else 0.0
+            note = f"{change:+.0%}"
+            if change > tolerance:
+                note += "  REGRESSION"
+                regressions.append(row["name"])
+        print(
+            f"{row['name']:<28} {row['items_per_s']:>12.1f} {row['p50_ms']:>9.2f} "
+            f"{row['p90_ms']:>9.2f} {row['p99_ms']:>9.2f}  {note}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run offline mediczuwacz benchmarks against a local fake gateway.")
+    parser.add_argument("--slots", type=int, default=5000, help="Slots served by the fake slots endpoint")
+    parser.add_argument("--doctors", type=int, default=40)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--window-days", type=int, default=3, help="End date window for the short-window search")
+    parser.add_argument("--messages", type=int, default=20, help="Notifications queued per dispatch run")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--full-login", action="store_true", help="Go through the login form instead of an immediate code")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p50 slowdown before flagging, as a fraction")
+    args = parser.parse_args()
+
+    results, counts = run(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = {row["name"]: row for row in json.load(f)["results"]}
+
+    regressions = print_results(results, baseline, args.tolerance)
+    print(f"Gateway requests: {json.dumps(counts, sort_keys=True)}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
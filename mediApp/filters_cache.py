@@ -0,0 +1,88 @@
+"""On-disk cache of search-appointments/filters responses."""
+import json
+import os
+import time
+
+
+def cache_key(region=None, specialty=None):
+    if isinstance(specialty, (list, tuple)):
+        specialty = ",".join(str(s) for s in sorted(specialty))
+    return f"{region or ''}|{specialty or ''}"
+
+
+class FiltersCache:
+    """Filter dictionaries keyed by (region, specialty).
+
+    Entries younger than `ttl` seconds are fresh. Older entries are still served
+    until `stale_ttl`, but the caller is expected to refetch them afterwards.
+    """
+
+    def __init__(self, path, ttl=24 * 3600, stale_ttl=30 * 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.entries = {}
+        self._index = None
+        if path and os.path.exists(path) and os.path.getsize(path) > 0:
+            try:
+                with open(path, "r") as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                self.entries = {}
+
+    def lookup(self, region=None, specialty=None):
+        """Return (filters, is_fresh), or (None, False) when nothing usable is cached."""
+        entry = self.entries.get(cache_key(region, specialty))
+        if not entry:
+            return None, False
+        age = time.time() - entry["fetched_at"]
+        if age > self.stale_ttl:
+            return None, False
+        return entry["filters"], age <= self.ttl
+
+    def put(self, region, specialty, filters):
+        if not filters:
+            return
+        self.entries[cache_key(region, specialty)] = {"fetched_at": time.time(), "filters": filters}
+        self._index = None
+        if self.path:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+
+    def index(self):
+        """{filter_type: {id: name}} over every cached response, and {(region, specialty): doctor ids}."""
+        if self._index is None:
+            names = {}
+            doctors = {}
+            for key, entry in self.entries.items():
+                for filter_type, values in entry["filters"].items():
+                    if not isinstance(values, list):
+                        continue
+                    bucket = names.setdefault(filter_type, {})
+                    for value in values:
+                        bucket[str(value.get("id"))] = value.get("value")
+                doctors[key] = {str(d.get("id")) for d in entry["filters"].get("doctors", [])}
+            self._index = (names, doctors)
+        return self._index
+
+    def name(self, filter_type, id):
+        return self.index()[0].get(filter_type, {}).get(str(id))
+
+    def label(self, filter_type, id):
+        """The ID followed by its cached name, e.g. "4798 (Ortopeda)", or just the ID."""
+        name = self.name(filter_type, id)
+        return f"{id} ({name})" if name else str(id)
+
+    def check(self, query):
+        """Warnings for IDs in a search query that the cached filters do not know. Never hits the network."""
+        names, doctors = self.index()
+        warnings = []
+        specialties = names.get("specialties")
+        if specialties and str(query.specialty) not in specialties:
+            warnings.append(f"unknown specialty {query.specialty}")
+        known_doctors = doctors.get(cache_key(query.region, query.specialty))
+        if query.doctor and known_doctors and str(query.doctor) not in known_doctors:
+            warnings.append(f"doctor {query.doctor} not found for specialty {self.label('specialties', query.specialty)}")
+        return warnings
@@ -0,0 +1,91 @@
+"""Incremental decoding of one array inside a large JSON response.
+
+The slots endpoint answers with {"items": [...], "page": ..., "totalCount": ...}.
+ArrayStream decodes the elements of "items" one at a time as the body arrives,
+so only the current element and one network chunk are held in memory, and the
+caller can stop reading (and close the connection) in the middle of the array.
+"""
+import codecs
+import json
+import re
+
+SCALAR = re.compile(r'"(\w+)"\s*:\s*(-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?|true|false|null|"(?:[^"\\]|\\.)*")')
+WHITESPACE = " \t\n\r,"
+TRIM_AT = 1 << 16
+
+
+class ArrayStream:
+    """Iterate over the elements of the array under `key` in a streamed JSON object.
+
+    Top-level scalar fields found before and after the array (page, totalCount,
+    ...) end up in `fields`; the ones after it only once the array was read to
+    the end.
+    """
+
+    def __init__(self, response, key="items", object_hook=None, chunk_size=16 * 1024):
+        self.response = response
+        self.chunks = response.iter_content(chunk_size=chunk_size)
+        self.text = codecs.getincrementaldecoder(response.encoding or "utf-8")()
+        self.decoder = json.JSONDecoder(object_hook=object_hook)
+        self.array_start = re.compile(rf'"{re.escape(key)}"\s*:\s*\[')
+        self.buffer = ""
+        self.fields = {}
+
+    def read(self):
+        """Append the next chunk to the buffer; False once the body is exhausted."""
+        for chunk in self.chunks:
+            if chunk:
+                self.buffer += self.text.decode(chunk)
+                return True
+        self.buffer += self.text.decode(b"", final=True)
+        return False
+
+    def scalars(self, text):
+        for name, value in SCALAR.findall(text):
+            self.fields.setdefault(name, json.loads(value))
+
+    def __iter__(self):
+        while True:
+            match = self.array_start.search(self.buffer)
+            if match:
+                break
+            if not self.read():
+                self.scalars(self.buffer)
+                return
+        self.scalars(self.buffer[:match.start()])
+
+        pos = match.end()
+        while True:
+            while pos < len(self.buffer) and self.buffer[pos] in WHITESPACE:
+                pos += 1
+            if pos >= len(self.buffer):
+                if not self.read():
+                    raise ValueError("JSON body ended inside the array")
+                continue
+            if self.buffer[pos] == "]":
+                while self.read():
+                    pass
+                self.scalars(self.buffer[pos + 1:])
+                return
+
+            try:
+                item, end = self.decoder.raw_decode(self.buffer, pos)
+            except json.JSONDecodeError:
+                # Most likely the element is cut off at the end of the buffer
+                if not self.read():
+                    raise
+                continue
+            yield item
+            pos = end
+            if pos > TRIM_AT:
+                self.buffer = self.buffer[pos:]
+                pos = 0
+
+    def close(self):
+        self.response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
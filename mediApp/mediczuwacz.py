@@ -2,32 +2,81 @@
 
 import base64
 import csv
+import dataclasses
 import hashlib
 import json
 import os
 import random
 import re
+import sqlite3
 import string
 import uuid
 import argparse
-from collections import defaultdict
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from dataclasses import dataclass
 from urllib.parse import parse_qs, urlparse
 import datetime
 import requests
-from bs4 import BeautifulSoup
-from dotenv import load_dotenv
-from fake_useragent import UserAgent
-from rich import print_json, print
-from rich.console import Console
 import time
 
-from medihunter_notifiers import pushbullet_notify, pushover_notify, telegram_notify, gotify_notify
-
-console = Console()
-
-# Load environment variables
-load_dotenv()
+from startup import lazy_import, startup_report
+
+# bs4, fake_useragent, rich, dotenv and notifiers are only imported on the code paths that need them
+
+from medihunter_notifiers import NotificationQueue, pushbullet_notify, pushover_notify, telegram_notify, gotify_notify
+from filters_cache import FiltersCache
+from json_stream import ArrayStream
+from metrics import metrics, summarize
+from profiling import CycleProfiler, compare as compare_profiles
+from release_profile import ReleaseProfile
+from reminder_store import ReminderStore
+from scheduler import RowScheduler
+from slot_history import SlotHistory
+from slots import group_by_day, slot_decoder, window, within_reminder_limit
+from snapshots import SnapshotStore
+from transport import CircuitOpen, ConcurrencyGovernor, RateLimiter, ResponseCache, configure_session
+from watchlist import RuleIndex, coalesce_queries, shard_queries
+
+class LazyConsole:
+    """Stands in for rich's Console and imports rich on the first call."""
+
+    def __init__(self):
+        self._console = None
+
+    def __getattr__(self, name):
+        if self._console is None:
+            self._console = lazy_import("rich.console").Console()
+        return getattr(self._console, name)
+
+console = LazyConsole()
+
+def print(*objects, **kwargs):
+    lazy_import("rich").print(*objects, **kwargs)
+
+_user_agent = None
+
+def cached_user_agent(path=None):
+    """Return one user agent string per process, reused across runs through `path` when given."""
+    global _user_agent
+    if _user_agent:
+        return _user_agent
+
+    _user_agent = os.environ.get("MEDICZUWACZ_USER_AGENT")
+    if not _user_agent and path and os.path.exists(path):
+        with open(path, "r") as f:
+            _user_agent = f.read().strip()
+    if not _user_agent:
+        _user_agent = lazy_import("fake_useragent").UserAgent().random
+        if path:
+            try:
+                with open(path, "w") as f:
+                    f.write(_user_agent)
+            except OSError:
+                pass
+    return _user_agent
 
 @dataclass
 class User:
@@ -42,19 +91,89 @@ users = [
     User("Klaudia", "MEDICOVER_USER", "MEDICOVER_PASS", "NOTIFIERS_TELEGRAM_CHAT_ID", "NOTIFIERS_TELEGRAM_TOKEN", "params.csv"),
 ]
 
+@dataclass(frozen=True)
+class SearchQuery:
+    region: int
+    specialty: int
+    clinic: int = None
+    start_date: datetime.date = None
+    end_date: datetime.date = None
+    language: int = None
+    search_type: object = 0
+    doctor: int = None
+
+@dataclass
+class WatchRow:
+    user: User
+    stars: int
+    query: SearchQuery
+    interval: int = None  # minutes, from the optional params.csv "interval" column
+
+    @property
+    def key(self):
+        return (self.user.name, self.stars, self.query)
+
+    @property
+    def snapshot_key(self):
+        query = json.dumps(dataclasses.asdict(self.query), default=str, sort_keys=True)
+        return hashlib.sha1(f"{self.user.name}:{query}".encode("utf-8")).hexdigest()[:16]
+
+class TokenCache:
+    """Access and refresh tokens per username, kept in a JSON file between runs."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def read_all(self):
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            try:
+                with open(self.path, "r") as f:
+                    return json.load(f)
+            except ValueError:
+                console.print("[yellow]Warning: token cache is corrupted, ignoring it[/yellow]")
+        return {}
+
+    def get(self, username):
+        return self.read_all().get(username)
+
+    def put(self, username, tokens):
+        data = self.read_all()
+        data[username] = {
+            "access_token": tokens["access_token"],
+            "refresh_token": tokens.get("refresh_token"),
+            "expires_at": time.time() + int(tokens.get("expires_in", 0)),
+        }
+        self.write_all(data)
+
+    def drop(self, username):
+        data = self.read_all()
+        if data.pop(username, None) is not None:
+            self.write_all(data)
+
+    def write_all(self, data):
+        # The file holds live credentials, so keep it readable by the owner only
+        tmp_path = f"{self.path}.tmp"
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
 class Authenticator:
-    def __init__(self, username, password):
+    login_url = "https://login-online24.medicover.pl"
+
+    def __init__(self, username, password, token_cache=None, user_agent=None, pool_size=16):
         self.username = username
         self.password = password
-        self.session = requests.Session()
+        self.token_cache = token_cache
+        self.session = configure_session(requests.Session(), pool_size=pool_size)
         self.mfa_used_in_this_run = False
         self.load_cookies()
         self.headers = {
-            "User-Agent": UserAgent().random,
+            "User-Agent": user_agent or cached_user_agent(),
             "Accept": "application/json",
             "Authorization": None
         }
         self.tokenA = None
+        self.lock = threading.Lock()
 
     def load_cookies(self):
         env_cookies_b64 = os.environ.get("MEDICZUWACZ_COOKIES_B64")
@@ -129,15 +248,81 @@ class Authenticator:
             "code_verifier": code_verifier,
             "client_id": "web",
         }
-        response = self.session.post(f"{login_url}/connect/token", data=token_data, headers=self.headers)
+        with metrics.timer("login", step="token"):
+            response = self.session.post(f"{login_url}/connect/token", data=token_data, headers=self.headers)
         tokens = response.json()
-        self.tokenA = tokens["access_token"]
-        self.headers["Authorization"] = f"Bearer {self.tokenA}"
+        self.use_tokens(tokens)
         if self.mfa_used_in_this_run:
             self.print_next_run_env()
 
+    def use_tokens(self, tokens):
+        self.tokenA = tokens["access_token"]
+        self.headers["Authorization"] = f"Bearer {self.tokenA}"
+        if self.token_cache:
+            self.token_cache.put(self.username, tokens)
+
+    def refresh(self, refresh_token):
+        """Get a new access token from a refresh token. Returns False if the gateway refuses it."""
+        token_data = {
+            "grant_type": "refresh_token",
+            "refresh_token": refresh_token,
+            "client_id": "web",
+        }
+        try:
+            with metrics.timer("login", step="refresh"):
+                response = self.session.post(f"{self.login_url}/connect/token", data=token_data, headers=self.headers)
+        except requests.RequestException as exc:
+            console.print(f"[yellow]Warning: token refresh failed: {exc}[/yellow]")
+            return False
+        if response.status_code != 200:
+            return False
+        tokens = response.json()
+        if "access_token" not in tokens:
+            return False
+        tokens.setdefault("refresh_token", refresh_token)
+        self.use_tokens(tokens)
+        return True
+
+    def login_from_cache(self):
+        """Reuse a cached access token, or refresh it. Returns True when no full login is needed."""
+        if not self.token_cache:
+            return False
+        cached = self.token_cache.get(self.username)
+        if not cached:
+            return False
+
+        # Keep a minute of margin so the token does not expire mid-cycle
+        if cached.get("expires_at", 0) - 60 > time.time():
+            self.tokenA = cached["access_token"]
+            self.headers["Authorization"] = f"Bearer {self.tokenA}"
+            return True
+
+        if cached.get("refresh_token") and self.refresh(cached["refresh_token"]):
+            return True
+
+        self.token_cache.drop(self.username)
+        return False
+
+    def reauthenticate(self, rejected):
+        """Replace an access token the gateway answered 401 to, given its Authorization header.
+
+        The cached token is dropped, then the refresh token is tried before a full
+        login. Searches that were rejected with the same token wait for the first
+        one instead of logging in again.
+        """
+        with self.lock:
+            if self.headers["Authorization"] != rejected:
+                return
+            cached = self.token_cache.get(self.username) if self.token_cache else None
+            if self.token_cache:
+                self.token_cache.drop(self.username)
+            if cached and cached.get("refresh_token") and self.refresh(cached["refresh_token"]):
+                return
+            with metrics.timer("login", step="full"):
+                self.full_login()
+
     def handle_mfa(self, response, mfa_url, login_url):
-        soup = BeautifulSoup(response.content, "html.parser")
+        soup = lazy_import("bs4").BeautifulSoup(response.content, "html.parser")
         error_div = soup.find("div", class_="alert-error")
         if error_div:
             error_msg = error_div.get_text(strip=True)
@@ -177,6 +362,13 @@ class Authenticator:
         return base64.urlsafe_b64encode(sha256).decode("utf-8").rstrip("=")
 
     def login(self):
+        with metrics.timer("login", step="cache"):
+            if self.login_from_cache():
+                return
+        with metrics.timer("login", step="full"):
+            self.full_login()
+
+    def full_login(self):
         state = "".join(random.choices(string.ascii_lowercase + string.digits, k=32))
         device_id = self.get_device_id()
         self.current_device_id = device_id
@@ -184,7 +376,7 @@ class Authenticator:
         code_challenge = self.generate_code_challenge(code_verifier)
         epoch_time = int(time.time()) * 1000
 
-        login_url = "https://login-online24.medicover.pl"
+        login_url = self.login_url
         oidc_redirect = "https://online24.medicover.pl/signin-oidc"
         auth_params = (
             f"?client_id=web&redirect_uri={oidc_redirect}&response_type=code"
@@ -194,7 +386,8 @@ class Authenticator:
         )
 
         # Step 1: Initialize login
-        response = self.session.get(f"{login_url}/connect/authorize{auth_params}", headers=self.headers, allow_redirects=False)
+        with metrics.timer("login", step="authorize"):
+            response = self.session.get(f"{login_url}/connect/authorize{auth_params}", headers=self.headers, allow_redirects=False)
         next_url = response.headers.get("Location")
 
         if next_url and "code=" in next_url:
@@ -203,8 +396,9 @@ class Authenticator:
             return
 
         # Step 2: Extract CSRF token
-        response = self.session.get(next_url, headers=self.headers, allow_redirects=False)
-        soup = BeautifulSoup(response.content, "html.parser")
+        with metrics.timer("login", step="csrf"):
+            response = self.session.get(next_url, headers=self.headers, allow_redirects=False)
+            soup = lazy_import("bs4").BeautifulSoup(response.content, "html.parser")
         csrf_input = soup.find("input", {"name": "__RequestVerificationToken"})
         if csrf_input:
             csrf_token = csrf_input.get("value")
@@ -220,7 +414,8 @@ class Authenticator:
             "Input.Button": "login",
             "__RequestVerificationToken": csrf_token,
         }
-        response = self.session.post(next_url, data=login_data, headers=self.headers, allow_redirects=False)
+        with metrics.timer("login", step="submit"):
+            response = self.session.post(next_url, data=login_data, headers=self.headers, allow_redirects=False)
         next_url = response.headers.get("Location")
 
         if next_url and "/Mfa" in next_url:
@@ -233,7 +428,8 @@ class Authenticator:
 
         # Step 4: Fetch authorization code
         step4_url = f"{login_url}{next_url}" if next_url and next_url.startswith("/") else next_url
-        response = self.session.get(step4_url, headers=self.headers, allow_redirects=False)
+        with metrics.timer("login", step="code"):
+            response = self.session.get(step4_url, headers=self.headers, allow_redirects=False)
         next_url = response.headers.get("Location")
         code = parse_qs(urlparse(next_url).query)["code"][0]
 
@@ -241,29 +437,140 @@ class Authenticator:
         self.exchange_code(login_url, oidc_redirect, code, code_verifier)
 
 class AppointmentFinder:
-    def __init__(self, session, headers):
+    api_url = "https://api-gateway-online24.medicover.pl"
+
+    def __init__(self, session, headers, rate_limiter=None, filters_cache=None, page_size=500, all_pages=False, max_pages=50,
+                 response_cache=None, stream=False, governor=None, auth=None):
         self.session = session
         self.headers = headers
-
-    def http_get(self, url, params):
-        response = self.session.get(url, headers=self.headers, params=params)
+        # The Authenticator whose headers these are, for logging in again on a 401
+        self.auth = auth
+        self.rate_limiter = rate_limiter
+        self.filters_cache = filters_cache
+        self.response_cache = response_cache
+        self.page_size = page_size
+        self.all_pages = all_pages
+        self.max_pages = max_pages
+        self.stream = stream
+        self.governor = governor
+
+    def gate(self, endpoint):
+        """Governor slot for one request to `endpoint`; the yielded list takes the status code."""
+        return self.governor.request(endpoint) if self.governor else nullcontext([])
+
+    def renew_token(self, response, rejected):
+        """On a 401, log the account in again; True when the request should be retried."""
+        if response.status_code != 401 or self.auth is None:
+            return False
+        response.close()
+        console.print("[yellow]Access token rejected, logging in again[/yellow]")
+        metrics.count("token_rejected")
+        self.auth.reauthenticate(rejected)
+        return True
+
+    def http_get(self, url, params, object_hook=None):
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+
+        cached = None
+        if self.response_cache is not None:
+            cache_key = ResponseCache.key(url, params)
+            cached = self.response_cache.get(cache_key)
+
+        endpoint = url.rsplit("/", 1)[-1]
+        for retry in (True, False):
+            rejected = self.headers["Authorization"]
+            headers = {**self.headers, **cached.validators()} if cached is not None else self.headers
+            with self.gate(endpoint) as status, metrics.timer("http_get", endpoint=endpoint):
+                response = self.session.get(url, headers=headers, params=params)
+                status.append(response.status_code)
+            metrics.count("http_responses", endpoint=endpoint, status=response.status_code)
+            if not (retry and self.renew_token(response, rejected)):
+                break
+        if response.status_code == 304 and cached is not None:
+            return self.response_cache.hit_not_modified(cached)
         if response.status_code == 200:
-            return response.json()
+            if self.response_cache is not None:
+                return self.response_cache.decode(cache_key, response, object_hook)
+            return response.json(object_hook=object_hook)
         else:
             console.print(
                 f"[bold red]Error {response.status_code}[/bold red]: {response.text}"
             )
-            return {}
+            # Raised rather than returned as {}, so that a failed search never looks like "no slots"
+            raise requests.HTTPError(f"{response.status_code} from {endpoint}", response=response)
+
+    def open_stream(self, url, params, object_hook=None):
+        """Send a GET with stream=True and return an ArrayStream over its "items"; raises HTTPError on an error status.
+
+        The response cache is bypassed: it needs the whole body to compare.
+        """
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+
+        endpoint = url.rsplit("/", 1)[-1]
+        for retry in (True, False):
+            rejected = self.headers["Authorization"]
+            # The governor slot is released once the headers are in, not when the body is read
+            with self.gate(endpoint) as status, metrics.timer("http_get", endpoint=endpoint, stream=True):
+                response = self.session.get(url, headers=self.headers, params=params, stream=True)
+                status.append(response.status_code)
+            metrics.count("http_responses", endpoint=endpoint, status=response.status_code)
+            if not (retry and self.renew_token(response, rejected)):
+                break
+        if response.status_code != 200:
+            console.print(
+                f"[bold red]Error {response.status_code}[/bold red]: {response.text}"
+            )
+            response.close()
+            raise requests.HTTPError(f"{response.status_code} from {endpoint}", response=response)
+        return ArrayStream(response, "items", object_hook)
+
+    def read_page(self, url, params, end_date):
+        """Yield the slots of one page; returns (items on the page, totalCount, whether any slot was past end_date)."""
+        # Slots are decoded straight into Appointments; everything downstream reads their fields
+        response = self.http_get(url, params, object_hook=slot_decoder())
+        items = response.get("items", [])
+        appointments, past_end = window([item for item in items if item is not None], end_date)
+        yield from appointments
+        return len(items), response.get("totalCount"), past_end
+
+    def stream_page(self, url, params, end_date):
+        """Like read_page, but slots are yielded while the page downloads.
+
+        Reading stops, and the connection is closed, at the first slot past end_date.
+        """
+        stream = self.open_stream(url, params, object_hook=slot_decoder())
+        count = 0
+        with stream:
+            for appointment in stream:
+                count += 1
+                if appointment is None:
+                    continue
+                if end_date and appointment.when.date() > end_date:
+                    if self.all_pages:
+                        continue
+                    return count, None, True
+                yield appointment
+        return count, stream.fields.get("totalCount"), False
 
     def find_appointments(self, region, specialty, clinic, start_date, end_date, language, search_type, doctor=None):
-        appointment_url = "https://api-gateway-online24.medicover.pl/appointments/api/search-appointments/slots"
+        return list(self.iter_appointments(region, specialty, clinic, start_date, end_date, language, search_type, doctor))
+
+    def iter_appointments(self, region, specialty, clinic, start_date, end_date, language, search_type, doctor=None):
+        """Yield slots page by page.
+
+        Slots come back in chronological order from StartTime, so paging stops at
+        the first slot after end_date unless `all_pages` is set.
+        """
+        appointment_url = f"{self.api_url}/appointments/api/search-appointments/slots"
         params = {
             "RegionIds": region,
             "SpecialtyIds": specialty,
             "ClinicIds": clinic,
             "Page": 1,
-            "PageSize": 5000,
-            "StartTime": start_date.isoformat(),
+            "PageSize": self.page_size,
+            "StartTime": (start_date or datetime.date.today()).isoformat(),
             "SlotSearchType": search_type,
             "VisitType": "Center",
         }
@@ -274,17 +581,60 @@ class AppointmentFinder:
         if doctor:
             params["DoctorIds"] = doctor
 
-        response = self.http_get(appointment_url, params)
+        read_page = self.stream_page if self.stream else self.read_page
+        for page in range(1, self.max_pages + 1):
+            params["Page"] = page
+            count, total, past_end = yield from read_page(appointment_url, params, end_date)
+            if past_end and not self.all_pages:
+                return
+            if count < self.page_size or (total is not None and page * self.page_size >= total):
+                return
+        else:
+            # Only reached when every page was full and totalCount, if known, says there is more
+            metrics.count("max_pages_reached", endpoint="slots")
+            console.print(
+                f"[yellow]Warning: stopped after {self.max_pages} pages of {self.page_size} slots for specialty {specialty}; "
+                f"{total if total is not None else 'more'} slots available. Set an end date or raise --page-size.[/yellow]"
+            )
+
+    def find_appointments_batch(self, queries, max_workers=4, coalesce=True):
+        """Run many searches at once; results come back in the order of `queries`.
 
-        items = response.get("items", [])
+        With `coalesce`, queries that differ only by doctor share one request. Every
+        response is then routed to all queries whose rules its slots match. A query
+        whose search failed, on any page, gets None instead of a slot list; so does
+        one held back by an open circuit breaker, which then skips this cycle.
+        """
+        def run(query):
+            try:
+                return self.find_appointments(
+                    query.region, query.specialty, query.clinic, query.start_date,
+                    query.end_date, query.language, query.search_type, query.doctor,
+                )
+            except CircuitOpen as exc:
+                metrics.count("search_skipped", reason="circuit_open")
+                console.print(f"[yellow]Skipping {query} this cycle: {exc}[/yellow]")
+                return None
+            except (requests.RequestException, ValueError) as exc:
+                console.print(f"[bold red]Search failed[/bold red] for {query}: {exc}")
+                return None
+
+        if coalesce:
+            plan = coalesce_queries(queries)
+        else:
+            plan = [(query, [index]) for index, query in enumerate(queries)]
 
-        if end_date:
-            items = [x for x in items if datetime.datetime.fromisoformat(x["appointmentDate"]).date() <= end_date]
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            results = list(pool.map(run, [request for request, _ in plan]))
+        return RuleIndex.compile(tuple(queries)).route_all(plan, results)
 
-        return items
+    def find_filters(self, region=None, specialty=None, refresh=False):
+        if self.filters_cache and not refresh:
+            filters, fresh = self.filters_cache.lookup(region, specialty)
+            if fresh:
+                return filters
 
-    def find_filters(self, region=None, specialty=None):
-        filters_url = "https://api-gateway-online24.medicover.pl/appointments/api/search-appointments/filters"
+        filters_url = f"{self.api_url}/appointments/api/search-appointments/filters"
 
         params = {"SlotSearchType": 0}
         if region:
@@ -292,7 +642,12 @@ class AppointmentFinder:
         if specialty:
             params["SpecialtyIds"] = specialty
 
-        response = self.http_get(filters_url, params)
+        try:
+            response = self.http_get(filters_url, params)
+        except requests.HTTPError:
+            return {}
+        if self.filters_cache:
+            self.filters_cache.put(region, specialty, response)
         return response
 
 class Notifier:
@@ -313,27 +668,23 @@ class Notifier:
             return f"{abs(delta)} days ago"
     
     @staticmethod
-    def format_appointments(appointments, stars=None):
-        """Format appointments into a human-readable string."""
+    def format_appointments(appointments, stars=None, grouped=None):
+        """Format appointments into a human-readable string.
+
+        `grouped` is the group_by_day() result when the caller already has it.
+        """
         if not appointments:
             return "No appointments found."
 
-        grouped = defaultdict(list)
-
-        for appointment in appointments:
-            date_str = appointment.get("appointmentDate", "")
-            try:
-                dt = datetime.datetime.fromisoformat(date_str)
-            except Exception:
-                continue  # Skip invalid dates
-            grouped[dt.date()].append(appointment)
+        if grouped is None:
+            grouped = group_by_day(appointments)
 
         messages = []
-        for date, items in sorted(grouped.items()):
-            doctor_names = sorted(set(item.get("doctor", {}).get("name", "N/A") for item in items))
+        for date, items in grouped:
+            doctor_names = sorted(set(item.doctor_name for item in items))
             doctor = ", ".join(doctor_names)
-            clinic = items[0].get("clinic", {}).get("name", "N/A")
-            specialty = items[0].get("specialty", {}).get("name", "N/A")
+            clinic = items[0].clinic_name
+            specialty = items[0].specialty_name
             count = len(items)
             star_visual = "★" * stars + "☆" * (3 - stars) if stars else "N/A"
 
@@ -342,7 +693,7 @@ class Notifier:
                     f"Doctor: {doctor}\n"
                     f"Specialty: {specialty}\n"
                     f"Clinic: {clinic}\n"
-                    f"Appointments: {count} ({', '.join(sorted([datetime.datetime.fromisoformat(item.get('appointmentDate')).strftime('%H:%M') for item in items]))})\n"
+                    f"Appointments: {count} ({', '.join(item.when.strftime('%H:%M') for item in items)})\n"
                     f"Stars: {star_visual}\n"
                     + "-" * 25
             )
@@ -351,18 +702,22 @@ class Notifier:
         return "\n".join(messages)
 
     @staticmethod
-    def send_notification(appointments, notifier, title, stars, chat_id, token):
-        """Send a notification with formatted appointments."""
+    def send_notification(appointments, notifier, title, stars, chat_id, token, dispatcher=None, grouped=None):
+        """Send a notification with formatted appointments, or queue it on `dispatcher`."""
         notifier = notifier.strip()
-        message = Notifier.format_appointments(appointments, stars)
-        if notifier == "pushbullet":
-            pushbullet_notify(message, title)
-        elif notifier == "pushover":
-            pushover_notify(message, title)
-        elif notifier == "telegram":
-            telegram_notify(message, title, chat_id, token)
-        elif notifier == "gotify":
-            gotify_notify(message, title)
+        message = Notifier.format_appointments(appointments, stars, grouped)
+        if dispatcher:
+            dispatcher.add(notifier, message, title, chat_id, token)
+            return
+        with metrics.timer("notification", backend=notifier):
+            if notifier == "pushbullet":
+                pushbullet_notify(message, title)
+            elif notifier == "pushover":
+                pushover_notify(message, title)
+            elif notifier == "telegram":
+                telegram_notify(message, title, chat_id, token)
+            elif notifier == "gotify":
+                gotify_notify(message, title)
 
 
 def display_appointments(appointments):
@@ -374,175 +729,537 @@ def display_appointments(appointments):
         console.print("New appointments found:")
         console.print("-" * 50)
         for appointment in appointments:
-            date = appointment.get("appointmentDate", "N/A")
-            clinic = appointment.get("clinic", {}).get("name", "N/A")
-            doctor = appointment.get("doctor", {}).get("name", "N/A")
-            specialty = appointment.get("specialty", {}).get("name", "N/A")
-            doctor_languages = appointment.get("doctorLanguages", [])
-            languages = ", ".join([lang.get("name", "N/A") for lang in doctor_languages]) if doctor_languages else "N/A"
-            console.print(f"Date: {date}")
-            console.print(f"  Clinic: {clinic}")
-            console.print(f"  Doctor: {doctor}")
-            console.print(f"  Specialty: {specialty}")
+            languages = ", ".join(appointment.languages) if appointment.languages else "N/A"
+            console.print(f"Date: {appointment.date_str}")
+            console.print(f"  Clinic: {appointment.clinic_name}")
+            console.print(f"  Doctor: {appointment.doctor_name}")
+            console.print(f"  Specialty: {appointment.specialty_name}")
             console.print(f"  Languages: {languages}")
             console.print("-" * 50)
 
-def exclude_today_only(appointments):
-    """Return True if all appointments are for today (i.e., nothing beyond today)."""
+def exclude_today_only(grouped):
+    """Return True if all appointments are for today (i.e., nothing beyond today).
+
+    Takes the group_by_day() result, so no dates are parsed again.
+    """
     today = datetime.date.today()
-    for appt in appointments:
-        try:
-            date = datetime.datetime.fromisoformat(appt.get("appointmentDate", "")).date()
-            if date != today:
-                return False
-        except Exception:
+    return all(date == today for date, _ in grouped)
+
+def read_params(path):
+    """Read the rows of a params.csv watchlist file."""
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, "r", newline="") as f:
+            return list(csv.DictReader(f))
+    print("Params file not found")
+    return []
+
+_compiled_params = {}
+
+def compile_params(path):
+    """Return the enabled rules of a params.csv file as (specialty, doctor, stars, interval) tuples.
+
+    The file is parsed again only when its mtime changes.
+    """
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    cached = _compiled_params.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    rules = []
+    for param in read_params(path):
+        if param['run'] == "no":
+            continue
+        rules.append((
+            int(param['service_id']),
+            int(param['doctor_id']) if param.get('doctor_id') else None,
+            int(param['stars']) if param.get('stars') else None,
+            int(param['interval']) if param.get('interval') else None,
+        ))
+    _compiled_params[path] = (mtime, rules)
+    return rules
+
+def build_watch_rows(args):
+    """Turn the enabled params.csv rows of every user into WatchRows."""
+    rows = []
+    for user in users:
+        for specialty, doctor, stars, interval in compile_params(user.file):
+            if specialty == 519:
+                search_type = "DiagnosticProcedure"
+            else:
+                search_type = 0
+            query = SearchQuery(
+                region=202,
+                specialty=specialty,
+                clinic=args.clinic,
+                start_date=args.date,
+                end_date=args.enddate,
+                language=args.language,
+                search_type=search_type,
+                doctor=doctor,
+            )
+            rows.append(WatchRow(user, stars if stars is not None else args.stars, query, interval))
+    return rows
+
+def search_rows(finders, rows, args):
+    """Search all rows, spread over the sessions of every logged-in account."""
+    queries = [row.query for row in rows]
+    if len(finders) == 1:
+        return finders[0].find_appointments_batch(queries, max_workers=args.workers, coalesce=not args.no_coalesce)
+
+    shards = shard_queries(queries, len(finders))
+
+    def run(finder, indexes):
+        return finder.find_appointments_batch(
+            [queries[i] for i in indexes], max_workers=args.workers, coalesce=not args.no_coalesce,
+        )
+
+    results = [[] for _ in rows]
+    with ThreadPoolExecutor(max_workers=len(finders)) as pool:
+        for indexes, shard_results in zip(shards, pool.map(run, finders, shards)):
+            for i, items in zip(indexes, shard_results):
+                results[i] = items
+    return results
+
+def process_rows(finders, rows, reminders, snapshots, args, dispatcher=None, profile=None, history=None):
+    """Search all rows, filter out slots that were already reported and notify about the rest.
+
+    Returns the SlotDiff of every row, or None for rows whose search failed; those
+    keep their snapshot and reminder state untouched until a search succeeds. New
+    slots of rows that had a snapshot before are recorded as release events in
+    `profile`, and every slot found goes into `history`.
+    """
+    # Find appointments
+    with metrics.timer("search"):
+        results = search_rows(finders, rows, args)
+
+    if history is not None:
+        history.record(
+            appointment for appointments in results if appointments is not None for appointment in appointments
+        )
+
+    diffs = []
+    for row, appointments in zip(rows, results):
+        user = row.user
+        if appointments is None:
+            console.print(f"[yellow]Skipping {user.name} {row.query.specialty}/{row.query.doctor}: search failed, retrying next cycle[/yellow]")
+            diffs.append(None)
             continue
-    return True
+        # On a query's first run every slot looks new; that says nothing about when slots are released
+        seen_before = row.snapshot_key in snapshots.snapshots
+        changes = snapshots.diff(row.snapshot_key, appointments)
+        diffs.append(changes)
+        if profile is not None and seen_before and changes.added:
+            profile.record(row.query.specialty, [appointment.doctor_id for appointment in changes.added])
+
+        #Filter appointments: only slots that were not there last time, at most 3 reminders each
+        filtered_appointments = list(within_reminder_limit(changes.added, reminders, user.name))
+        grouped = group_by_day(filtered_appointments)
+
+        #Save reminders of appointments
+        reminders.flush()
+
+        # Display appointments
+        display_appointments(filtered_appointments)
+        console.print(f"All appointments: {len(appointments)}")
+        console.print(f"New: {len(changes.added)}, gone: {len(changes.removed)}, unchanged: {changes.persisted}")
+        console.print(f"Filtered appointments: {len(filtered_appointments)}")
+
+        # Send notification if appointments are found
+        if filtered_appointments and (
+                not args.exclude_today or not exclude_today_only(grouped)):
+            Notifier.send_notification(filtered_appointments, args.notification, args.title, row.stars,  os.environ.get(user.telegramChatId), os.environ.get(user.telegramToken), dispatcher, grouped)
+
+    snapshots.save()
+
+    # One merged message per chat for the whole cycle, sent in the background
+    if dispatcher:
+        dispatcher.flush()
+    return diffs
+
+def make_scheduler(args, default_interval):
+    """RowScheduler for the daemon or an --adaptive run; intervals in args are in minutes."""
+    if not args.adaptive:
+        return RowScheduler(default_interval * 60, jitter=getattr(args, "jitter", 0.0))
+    return RowScheduler(
+        default_interval * 60, jitter=getattr(args, "jitter", 0.0),
+        max_interval=args.max_interval * 60, hot_interval=args.hot_interval * 60, idle_runs=args.idle_runs,
+    )
+
+def reschedule_rows(scheduler, keys, rows, diffs, profile):
+    now = time.time()
+    for key, row, changes in zip(keys, rows, diffs):
+        window = profile.next_window(row.query.specialty, row.query.doctor, now) if profile else None
+        # A failed search says nothing about whether the row changed
+        changed = None if changes is None else bool(changes.added or changes.removed)
+        scheduler.reschedule(key, now, changed=changed, window=window)
+
+def run_adaptive(finders, rows, reminders, snapshots, args, dispatcher, profile, history=None):
+    """One-shot run that only searches the rows whose adaptive schedule says they are due.
+
+    The schedule is kept in the release profile between runs, so a cron job can
+    call this as often as it likes.
+    """
+    scheduler = make_scheduler(args, args.interval or 15)
+    rows_by_key = {row.snapshot_key: row for row in rows}
+    scheduler.sync({key: row.interval * 60 if row.interval else None for key, row in rows_by_key.items()})
+    scheduler.restore(profile.rows)
+
+    # A minute of slack so that a row due just after the cron tick is not put off to the next one
+    due_keys = scheduler.pop_due(time.time() + 60)
+    console.print(f"Adaptive schedule: {len(due_keys)} of {len(rows_by_key)} params rows due")
+    due = [rows_by_key[key] for key in due_keys]
+    if due:
+        diffs = process_rows(finders, due, reminders, snapshots, args, dispatcher, profile, history)
+        reschedule_rows(scheduler, due_keys, due, diffs, profile)
+    profile.rows = scheduler.state()
+    profile.dirty = True
+
+def check_watch_rows(rows, filters_cache):
+    """Warn about params.csv IDs that the cached filters do not know, without calling the API."""
+    if not filters_cache:
+        return
+    for row in rows:
+        for warning in filters_cache.check(row.query):
+            console.print(f"[yellow]Warning: {row.user.file}: {warning}[/yellow]")
+
+def print_cache_stats(response_cache):
+    if response_cache is None:
+        return
+    stats = response_cache.stats()
+    console.print(
+        f"Response cache: {stats['hits']} hits ({stats['not_modified']} not modified, {stats['same_body']} same body), "
+        f"{stats['misses']} misses"
+    )
+
+def print_governor_stats(governor):
+    if governor is None:
+        return
+    for endpoint, state in governor.stats().items():
+        paused = ", paused" if state["paused"] else ""
+        console.print(
+            f"Concurrency {endpoint}: limit {state['limit']}, {state['cuts']} cuts, {state['trips']} breaker trips{paused}"
+        )
+
+def print_stats(path, hours=None):
+    if not os.path.exists(path):
+        console.print(f"No metrics recorded yet in {path}; run with --metrics first.")
+        return
+    since = time.time() - hours * 3600 if hours else None
+    console.print(f"{'stage':<14} {'labels':<32} {'count':>6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for stage, labels, count, p50, p90, p99, top in summarize(path, since):
+        label_text = ",".join(f"{k}={v}" for k, v in labels)
+        console.print(
+            f"{stage:<14} {label_text:<32} {count:>6} {p50 * 1000:>9.1f} {p90 * 1000:>9.1f} {p99 * 1000:>9.1f} {top * 1000:>9.1f}",
+            markup=False,
+        )
+
+def print_history(history, args):
+    columns, rows = history.query(args.group, args.specialty, args.doctor, args.clinic, args.days, args.limit)
+    if not rows:
+        console.print("No slots recorded yet; the history fills up as find-appointment or daemon runs.")
+        return
+    widths = [max(len(str(column)), *(len(str(row[i])) for row in rows)) for i, column in enumerate(columns)]
+    console.print("  ".join(f"{column:<{width}}" for column, width in zip(columns, widths)), markup=False)
+    for row in rows:
+        console.print("  ".join(f"{value!s:<{width}}" for value, width in zip(row, widths)), markup=False)
+
+def print_filters(filters, filter_type):
+    for r in filters.get(filter_type, []):
+        print(f"{r['id']} - {r['value']}")
+
+def params_mtimes():
+    return {user.file: os.path.getmtime(user.file) if os.path.exists(user.file) else None for user in users}
+
+def run_daemon(args, auths, finders, reminders, snapshots, dispatcher, filters_cache=None, profile=None, history=None):
+    """Keep one session alive and poll each params.csv row on its own schedule."""
+    scheduler = make_scheduler(args, args.interval)
+    rows_by_key = {}
+    mtimes = None
+
+    while True:
+        # Re-read params.csv only when one of the files has changed
+        current_mtimes = params_mtimes()
+        if current_mtimes != mtimes:
+            mtimes = current_mtimes
+            rows_by_key = {row.key: row for row in build_watch_rows(args)}
+            check_watch_rows(rows_by_key.values(), filters_cache)
+            scheduler.sync({key: row.interval * 60 if row.interval else None for key, row in rows_by_key.items()})
+            console.print(f"Watching {len(rows_by_key)} params rows")
+
+        due = [rows_by_key[key] for key in scheduler.pop_due(time.time())]
+        if due:
+            try:
+                # Reuses the cached tokens and only hits the login host once they expire
+                for auth in auths:
+                    auth.login()
+                diffs = process_rows(finders, due, reminders, snapshots, args, dispatcher, profile, history)
+                if args.metrics:
+                    metrics.export(os.path.dirname(reminders.path))
+                if profile:
+                    profile.save()
+            except (requests.RequestException, ValueError, OSError, sqlite3.Error, EOFError) as exc:
+                # A hiccup on the login host or gateway, a state file or the history database, or a 2FA
+                # prompt with no terminal must not end the daemon; retry the rows on the next tick
+                console.print(f"[bold red]Cycle failed[/bold red]: {exc}")
+                retry_at = time.time() + args.reload_every
+                for row in due:
+                    scheduler.schedule(row.key, retry_at)
+                continue
+            print_cache_stats(finders[0].response_cache)
+            print_governor_stats(finders[0].governor)
+            reschedule_rows(scheduler, [row.key for row in due], due, diffs, profile if args.adaptive else None)
+
+        next_run = scheduler.next_run_time()
+        wait = next_run - time.time() if next_run else args.reload_every
+        time.sleep(min(max(wait, 1), args.reload_every))
+
+def finish_profile(profiler):
+    report = profiler.stop()
+    console.print(f"Profile saved: {report} (raw data in {profiler.base}.prof)")
+
+def resolve_profile(path, directory):
+    """Accept a saved profile by full path or by its name in the shared directory."""
+    stem = os.path.splitext(path)[0] if path.endswith((".prof", ".txt", ".json")) else path
+    if not os.path.exists(f"{stem}.prof") and not os.path.isabs(stem):
+        stem = os.path.join(directory, stem)
+    return stem
+
+def print_profile_comparison(before, after, limit):
+    memory, rows = compare_profiles(before, after, limit)
+    for line in memory:
+        console.print(line, markup=False)
+    console.print(f"{'calls':>15} {'cumulative s':>19} {'change':>8}  function")
+    for func, old_calls, new_calls, old_cum, new_cum in rows:
+        console.print(
+            f"{old_calls:>7}->{new_calls:<7} {old_cum:>9.3f}->{new_cum:<9.3f} {new_cum - old_cum:>+8.3f}  {func}",
+            markup=False,
+        )
+
+def print_startup_report():
+    timings, total = startup_report()
+    console.print("Deferred imports:")
+    for name, seconds in timings:
+        console.print(f"  {name:<16} {seconds * 1000:8.1f} ms")
+    console.print(f"  {'whole run':<16} {total * 1000:8.1f} ms")
 
 def main():
     parser = argparse.ArgumentParser(description="Find appointment slots.")
+    parser.add_argument("--profile-startup", action="store_true", help="Report how long heavy imports took")
+    parser.add_argument("--metrics", action="store_true", help="Export stage timings to metrics.jsonl and metrics.prom in /app/shared")
     subparsers = parser.add_subparsers(dest="command", required=True, help="Command to execute")
 
-    find_appointment = subparsers.add_parser("find-appointment", help="Find appointment")
-    find_appointment.add_argument("-r", "--region", required=False, type=int, help="Region ID")
-    find_appointment.add_argument("-s", "--specialty", required=False, type=int, action="extend", nargs="+", help="Specialty ID",)
-    find_appointment.add_argument("-c", "--clinic", required=False, type=int, help="Clinic ID")
-    find_appointment.add_argument("-d", "--doctor", required=False, type=int, help="Doctor ID")
-    find_appointment.add_argument("-f", "--date", type=datetime.date.fromisoformat, default=datetime.date.today(), help="Start date in YYYY-MM-DD format")
-    find_appointment.add_argument("-e", "--enddate", type=datetime.date.fromisoformat, help="End date in YYYY-MM-DD format")
-    find_appointment.add_argument("-n", "--notification", required=False, help="Notification method")
-    find_appointment.add_argument("-t", "--title", required=False, help="Notification title")
-    find_appointment.add_argument("-l", "--language", required=False, type=int, help="4=Polski, 6=Angielski, 60=Ukraiński")
+    search_options = argparse.ArgumentParser(add_help=False)
+    search_options.add_argument("-r", "--region", required=False, type=int, help="Region ID")
+    search_options.add_argument("-s", "--specialty", required=False, type=int, action="extend", nargs="+", help="Specialty ID",)
+    search_options.add_argument("-c", "--clinic", required=False, type=int, help="Clinic ID")
+    search_options.add_argument("-d", "--doctor", required=False, type=int, help="Doctor ID")
+    search_options.add_argument("-f", "--date", type=datetime.date.fromisoformat, help="Start date in YYYY-MM-DD format (default: today)")
+    search_options.add_argument("-e", "--enddate", type=datetime.date.fromisoformat, help="End date in YYYY-MM-DD format")
+    search_options.add_argument("-n", "--notification", required=False, help="Notification method")
+    search_options.add_argument("-t", "--title", required=False, help="Notification title")
+    search_options.add_argument("-l", "--language", required=False, type=int, help="4=Polski, 6=Angielski, 60=Ukraiński")
+    search_options.add_argument("--stars", type=int,  required=False, help="Preferred doctor rating (1 to 3 stars)")
+    search_options.add_argument("--exclude-today", action="store_true", help="Skip displaying appointments that are only for today",)
+    search_options.add_argument("--workers", type=int, default=4, help="Number of searches run at the same time")
+    search_options.add_argument("--rps", type=float, default=2.0, help="Maximum API requests per second (0 = unlimited)")
+    search_options.add_argument("--no-coalesce", action="store_true", help="Send one request per params.csv row instead of one per specialty")
+    search_options.add_argument("--page-size", type=int, default=500, help="Slots requested per page")
+    search_options.add_argument("--all-pages", action="store_true", help="Walk every page instead of stopping at the first slot after the end date")
+    search_options.add_argument("--no-governor", action="store_true", help="Do not adapt the number of in-flight requests to gateway latency and errors")
+    search_options.add_argument("--stream", action="store_true", help="Decode slots while they download and stop reading at the end date (bypasses the response cache)")
+    search_options.add_argument("--pool", action="store_true", help="Log in with every configured account and split the searches between them")
+
+    adaptive_options = argparse.ArgumentParser(add_help=False)
+    adaptive_options.add_argument("--adaptive", action="store_true", help="Back off on rows that do not change and poll more often around learned slot release times")
+    adaptive_options.add_argument("--max-interval", type=int, default=240, help="Longest back-off between two searches of a row, in minutes")
+    adaptive_options.add_argument("--hot-interval", type=int, default=2, help="Polling interval inside a release window, in minutes")
+    adaptive_options.add_argument("--idle-runs", type=int, default=4, help="Unchanged searches in a row before a row starts backing off")
+
+    find_appointment = subparsers.add_parser("find-appointment", parents=[search_options, adaptive_options], help="Find appointment")
     find_appointment.add_argument("-i", "--interval", required=False, type=int, help="Repeat interval in minutes")
-    find_appointment.add_argument("--stars", type=int,  required=False, help="Preferred doctor rating (1 to 3 stars)")
-    find_appointment.add_argument("--exclude-today", action="store_true", help="Skip displaying appointments that are only for today",)
+    find_appointment.add_argument("--profile", action="store_true", help="Run under cProfile and tracemalloc and save the reports to /app/shared")
+
+    daemon = subparsers.add_parser("daemon", parents=[search_options, adaptive_options], help="Keep running and poll every params.csv row on its own interval")
+    daemon.add_argument("-i", "--interval", type=int, default=15, help="Default polling interval in minutes for rows without an interval column")
+    daemon.add_argument("--jitter", type=float, default=0.1, help="Random spread of each interval, as a fraction of it")
+    daemon.add_argument("--reload-every", type=int, default=30, help="How often to check params files for changes, in seconds")
 
     list_filters = subparsers.add_parser("list-filters", help="List filters")
     list_filters_subparsers = list_filters.add_subparsers(dest="filter_type", required=True, help="Type of filter to list")
 
-    regions = list_filters_subparsers.add_parser("regions", help="List available regions")
-    specialties = list_filters_subparsers.add_parser("specialties", help="List available specialties")
-    doctors = list_filters_subparsers.add_parser("doctors", help="List available doctors")
+    filter_options = argparse.ArgumentParser(add_help=False)
+    filter_options.add_argument("--refresh", action="store_true", help="Ignore the filters cache and ask the API")
+    filter_options.add_argument("--cache-ttl", type=float, default=24, help="Hours before cached filters are fetched again")
+    filter_options.add_argument("--profile", action="store_true", help="Run under cProfile and tracemalloc and save the reports to /app/shared")
+
+    regions = list_filters_subparsers.add_parser("regions", parents=[filter_options], help="List available regions")
+    specialties = list_filters_subparsers.add_parser("specialties", parents=[filter_options], help="List available specialties")
+    doctors = list_filters_subparsers.add_parser("doctors", parents=[filter_options], help="List available doctors")
     doctors.add_argument("-r", "--region", required=True, type=int, help="Region ID")
     doctors.add_argument("-s", "--specialty", required=True, type=int, help="Specialty ID")
-    clinics = list_filters_subparsers.add_parser("clinics", help="List available clinics")
+    clinics = list_filters_subparsers.add_parser("clinics", parents=[filter_options], help="List available clinics")
     clinics.add_argument("-r", "--region", required=True, type=int, help="Region ID")
     clinics.add_argument("-s", "--specialty", required=True, type=int, nargs="+", help="Specialty ID(s)")
 
+    compact_state = subparsers.add_parser("compact-state", help="Drop past slots from the reminder state and rewrite it")
+    compact_state.add_argument("--max-per-key", type=int, required=False, help="Keep at most N most recently seen slots per user and doctor")
+
+    stats = subparsers.add_parser("stats", help="Summarize the timings recorded with --metrics")
+    stats.add_argument("--hours", type=float, required=False, help="Only include the last N hours")
+
+    history_command = subparsers.add_parser("history", help="Aggregate the archive of every slot seen so far")
+    history_command.add_argument("group", choices=["doctors", "clinics", "hours"], help="Group per doctor, per clinic or per UTC hour the slots first showed up")
+    history_command.add_argument("-s", "--specialty", type=int, required=False, help="Specialty ID")
+    history_command.add_argument("-d", "--doctor", type=int, required=False, help="Doctor ID")
+    history_command.add_argument("-c", "--clinic", type=int, required=False, help="Clinic ID")
+    history_command.add_argument("--days", type=float, required=False, help="Only slots first seen in the last N days")
+    history_command.add_argument("--limit", type=int, default=20, help="Number of rows to show")
+
+    compare_profiles_command = subparsers.add_parser("compare-profiles", help="Compare two profiles saved with --profile")
+    compare_profiles_command.add_argument("before", help="Saved profile, e.g. profile-find-appointment-20250101-120000")
+    compare_profiles_command.add_argument("after", help="Saved profile to compare against the first one")
+    compare_profiles_command.add_argument("--limit", type=int, default=25, help="Number of functions to show")
 
     args = parser.parse_args()
 
-    random_user = random.choice(users)
-    print(f"Selected {random_user}")
-    username = os.environ.get(random_user.user)
-    password = os.environ.get(random_user.password)
+    if args.profile_startup:
+        atexit.register(print_startup_report)
 
-    if not username or not password:
-        console.print("[bold red]Error:[/bold red] MEDICOVER_USER and MEDICOVER_PASS environment variables must be set.")
-        exit(1)
+    # Load environment variables
+    lazy_import("dotenv").load_dotenv()
 
-    print("jestem init")
     docker_path = '/app/shared'
     filename_doctors = f'{docker_path}/doctor_data.json'
     #filename_doctors = 'doctor_data.json'
+    max_reminders = os.environ.get("MEDICZUWACZ_MAX_REMINDERS")
+    max_reminders = int(max_reminders) if max_reminders else None
+
+    if args.metrics:
+        metrics.record_events = True
+        atexit.register(metrics.export, docker_path)
+
+    if args.command == "stats":
+        print_stats(f'{docker_path}/metrics.jsonl', args.hours)
+        return
+
+    if getattr(args, "profile", False):
+        # Everything from here on is profiled, including the worker threads, and reported at exit
+        profiler = CycleProfiler(docker_path, args.command)
+        profiler.start()
+        atexit.register(finish_profile, profiler)
+
+    if args.command == "compare-profiles":
+        print_profile_comparison(resolve_profile(args.before, docker_path), resolve_profile(args.after, docker_path), args.limit)
+        return
+
+    if args.command == "history":
+        history = SlotHistory(f'{docker_path}/slot_history.sqlite3')
+        print_history(history, args)
+        history.close()
+        return
+
+    if args.command == "compact-state":
+        reminders = ReminderStore(filename_doctors, max_per_key=args.max_per_key or max_reminders)
+        reminders.compact()
+        console.print(f"Reminder state compacted: {len(reminders)} slots in {len(reminders.index)} keys")
+        return
+
+    filters_cache = FiltersCache(f'{docker_path}/filters_cache.json')
+    served_from_cache = False
+    if args.command == "list-filters":
+        filters_cache.ttl = args.cache_ttl * 3600
+        if args.filter_type in ("doctors", "clinics"):
+            filter_region, filter_specialty = args.region, args.specialty
+        else:
+            filter_region, filter_specialty = None, None
+
+        # Answer from the cache without logging in; a stale entry is printed first and refetched afterwards
+        filters, fresh = filters_cache.lookup(filter_region, filter_specialty)
+        if filters and not args.refresh:
+            print_filters(filters, args.filter_type)
+            if fresh:
+                return
+            served_from_cache = True
+
+    if getattr(args, "pool", False):
+        accounts = [user for user in users if os.environ.get(user.user) and os.environ.get(user.password)]
+    else:
+        accounts = [random.choice(users)]
+    print(f"Selected {accounts}")
+
+    if not accounts or not all(os.environ.get(user.user) and os.environ.get(user.password) for user in accounts):
+        console.print("[bold red]Error:[/bold red] MEDICOVER_USER and MEDICOVER_PASS environment variables must be set.")
+        exit(1)
+
+    print("jestem init")
+    reminders = ReminderStore(filename_doctors, max_per_key=max_reminders)
+    snapshots = SnapshotStore(f'{docker_path}/slot_snapshots.json')
+    profile = ReleaseProfile(f'{docker_path}/release_profile.json')
+    history = SlotHistory(f'{docker_path}/slot_history.sqlite3')
+    dispatcher = NotificationQueue()
+    token_cache = TokenCache(f'{docker_path}/token_cache.json')
+    user_agent = cached_user_agent(f'{docker_path}/user_agent.txt')
+    # Shared by all accounts: the slots of a query do not depend on who asks
+    response_cache = ResponseCache()
 
     while True:
         print("jestem while")
         # Authenticate
-        auth = Authenticator(username, password)
-        auth.login()
-    
-        finder = AppointmentFinder(auth.session, auth.headers)
-
-        if args.command == "find-appointment":
-            print("jestem find-appointment")
+        auths = []
+        for account in accounts:
+            auth = Authenticator(
+                os.environ.get(account.user), os.environ.get(account.password), token_cache, user_agent,
+                pool_size=max(16, getattr(args, "workers", 0)),
+            )
+            auth.login()
+            auths.append(auth)
 
-            for user in users:
-                if os.path.exists(user.file) and os.path.getsize(user.file) > 0:
-                    with open(user.file, "r", newline="") as f:
-                        reader = csv.DictReader(f)
-                        params_from_file = list(reader)
+        finders = [
+            AppointmentFinder(auth.session, auth.headers, filters_cache=filters_cache, response_cache=response_cache, auth=auth)
+            for auth in auths
+        ]
+        finder = finders[0]
+
+        if args.command in ("find-appointment", "daemon"):
+            print(f"jestem {args.command}")
+            # Every account gets its own rate budget
+            for account_finder in finders:
+                account_finder.rate_limiter = RateLimiter(args.rps)
+                account_finder.page_size = args.page_size
+                account_finder.all_pages = args.all_pages
+                account_finder.stream = args.stream
+            # One governor for all accounts: gateway health does not depend on who is asking
+            governor = None if args.no_governor else ConcurrencyGovernor(maximum=max(1, args.workers) * len(finders))
+            for account_finder in finders:
+                account_finder.governor = governor
+            args.notification = 'telegram'
+
+            if args.command == "daemon":
+                try:
+                    run_daemon(args, auths, finders, reminders, snapshots, dispatcher, filters_cache, profile, history)
+                except KeyboardInterrupt:
+                    console.print("Stopping daemon")
+            else:
+                rows = build_watch_rows(args)
+                check_watch_rows(rows, filters_cache)
+                if args.adaptive:
+                    run_adaptive(finders, rows, reminders, snapshots, args, dispatcher, profile, history)
                 else:
-                    print("Params file not found")
-                    params_from_file = []
-
-                for param in params_from_file:
-                    print("jestem for")
-                    if param['run'] == "no":
-                        continue
-
-                    args.region = 202
-                    args.specialty = int(param['service_id'])
-                    args.doctor = int(param['doctor_id']) if param.get('doctor_id') else None
-                    args.star = int(param['stars'])
-                    args.notification = 'telegram'
-
-                    # Find appointments
-                    if args.specialty == [519] or args.specialty == 519:
-                        search_type = "DiagnosticProcedure"
-                    else:
-                        search_type = 0
-                    appointments = finder.find_appointments(args.region, args.specialty, args.clinic, args.date, args.enddate, args.language, search_type, args.doctor)
-                    filtered_appointments = []
-
-                    #Read file with reminders of appointments
-                    if os.path.exists(filename_doctors) and os.path.getsize(filename_doctors) > 0:
-                        with open(filename_doctors, "r") as f:
-                            doctors_from_file = json.load(f)
-                    else:
-                        doctors_from_file = {}
-
-                    #Filter appointments
-                    for appt in appointments:
-                        doctor_id = appt['doctor']['id']
-                        app_date =  appt['appointmentDate']
-                        key = f'{user.name}_{doctor_id}'
-
-                        if key not in doctors_from_file:
-                            doctors_from_file[key] = []
-
-                        # Look for matching appointment date
-                        for existing_appt in doctors_from_file[key]:
-                            if existing_appt["appointmentDate"] == app_date:
-                                existing_appt["reminderCount"] += 1
-                                if existing_appt["reminderCount"] <= 3:
-                                    filtered_appointments.append(appt)
-                                break
-                        else:
-                            # No existing appointment found, add new one
-                            doctors_from_file[key].append({
-                                "appointmentDate": app_date,
-                                "reminderCount": 1
-                            })
-                            filtered_appointments.append(appt)
-
-                    #Save file with reminders of appointments
-                    with open(filename_doctors, "w") as f:
-                        json.dump(doctors_from_file, f, indent=4)
-
-                    # Display appointments
-                    display_appointments(filtered_appointments)
-                    console.print(f"All appointments: {len(appointments)}")
-                    console.print(f"Filtered appointments: {len(filtered_appointments)}")
-
-                    # Send notification if appointments are found
-                    if filtered_appointments and (
-                            not args.exclude_today or not exclude_today_only(filtered_appointments)):
-                        Notifier.send_notification(filtered_appointments, args.notification, args.title, args.stars,  os.environ.get(user.telegramChatId), os.environ.get(user.telegramToken))
-                    time.sleep(5)
+                    process_rows(finders, rows, reminders, snapshots, args, dispatcher, profile, history)
+                print_cache_stats(response_cache)
+                print_governor_stats(governor)
         elif args.command == "list-filters":
-    
-            if args.filter_type in ("doctors", "clinics"):
-                filters = finder.find_filters(args.region, args.specialty)
-            else:
-                filters = finder.find_filters()
-
-    
-            for r in filters[args.filter_type]:
-                print(f"{r['id']} - {r['value']}")
+            filters = finder.find_filters(filter_region, filter_specialty, refresh=True)
+            if not served_from_cache:
+                print_filters(filters, args.filter_type)
 
 
         break
 
+    reminders.close()
+    profile.save()
+    history.close()
+    dispatcher.close()
+
 if __name__ == "__main__":
     main()
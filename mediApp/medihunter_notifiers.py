@@ -1,19 +1,32 @@
-from notifiers import get_notifier
-from notifiers.exceptions import BadArguments
+from collections import OrderedDict
+from functools import lru_cache
 from os import environ
+import queue
+import threading
+import time
+
 import requests
 
-pushbullet = get_notifier('pushbullet')
-pushover = get_notifier('pushover')
-telegram = get_notifier('telegram')
+from metrics import metrics
+from startup import lazy_import
+
+
+@lru_cache(maxsize=None)
+def get_backend(name):
+    """Create a notifiers backend the first time it is used."""
+    return lazy_import('notifiers').get_notifier(name)
+
+def bad_arguments():
+    return lazy_import('notifiers.exceptions').BadArguments
 
 def pushbullet_notify(message, title: str = None):
+    pushbullet = get_backend('pushbullet')
     try:
         if title is None:
             r = pushbullet.notify(message=message)
         else:
             r = pushbullet.notify(message=message, title=title)
-    except BadArguments as e:
+    except bad_arguments() as e:
         print(f'Pushbullet failed\n{e}')
         return
 
@@ -21,12 +34,13 @@ def pushbullet_notify(message, title: str = None):
         print(f'Pushbullet notification failed:\n{r.errors}')
 
 def pushover_notify(message, title: str = None):
+    pushover = get_backend('pushover')
     try:
         if title is None:
             r = pushover.notify(message=message)
         else:
             r = pushover.notify(message=message, title=title)
-    except BadArguments as e:
+    except bad_arguments() as e:
         print(f'Pushover failed\n{e}')
         return
 
@@ -35,6 +49,7 @@ def pushover_notify(message, title: str = None):
 
 
 def telegram_notify(message, title: str = None, chat_id: str = None, token: str = None):
+    telegram = get_backend('telegram')
     try:
         print(chat_id, token)
         if title:
@@ -44,7 +59,7 @@ def telegram_notify(message, title: str = None, chat_id: str = None, token: str
                             parse_mode='html',
                             chat_id=chat_id,
                             token=token)
-    except BadArguments as e:
+    except bad_arguments() as e:
         print(f'Telegram notifications require NOTIFIERS_TELEGRAM_CHAT_ID'
               f' and NOTIFIERS_TELEGRAM_TOKEN environments to be exported. Detailed exception:\n{e}')
         return
@@ -80,3 +95,151 @@ def gotify_notify(message, title: str = None):
 
     except requests.exceptions.RequestException as e:
         print(f'GOTIFY notification failed:\n{e}')
+
+
+TELEGRAM_MAX_LENGTH = 4096
+
+class NotificationQueue:
+    """Background notification sender.
+
+    The search loop only calls add(); flush() merges everything collected in
+    one cycle into a single message per backend and chat, and a worker thread
+    sends it with one pooled HTTP session per backend, retrying with backoff.
+    """
+
+    def __init__(self, max_retries=3, backoff=2.0):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.pending = OrderedDict()
+        self.sessions = {}
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self.run, name="notifications", daemon=True)
+        self.worker.start()
+
+    def add(self, backend, message, title: str = None, chat_id: str = None, token: str = None):
+        key = (backend, chat_id, token)
+        self.pending.setdefault(key, []).append((title, message))
+
+    def flush(self):
+        """Hand the messages collected so far to the worker, one merged message per backend and chat."""
+        pending, self.pending = self.pending, OrderedDict()
+        for (backend, chat_id, token), parts in pending.items():
+            self.queue.put((backend, chat_id, token, parts))
+
+    def close(self, timeout=60):
+        """Send whatever is still queued and stop the worker."""
+        self.flush()
+        self.queue.put(None)
+        self.worker.join(timeout)
+
+    def session(self, backend):
+        if backend not in self.sessions:
+            self.sessions[backend] = requests.Session()
+        return self.sessions[backend]
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            backend, chat_id, token, parts = job
+            try:
+                with metrics.timer('notification', backend=backend):
+                    self.dispatch(backend, chat_id, token, parts)
+            except Exception as e:
+                print(f'{backend} notification failed:\n{e}')
+
+    def dispatch(self, backend, chat_id, token, parts):
+        if backend == 'telegram':
+            text = '\n\n'.join(f'<b>{title}</b>\n{message}' if title else message for title, message in parts)
+            for chunk in split_message(text, TELEGRAM_MAX_LENGTH):
+                self.send_telegram(chunk, chat_id, token)
+        elif backend == 'gotify':
+            titles = [title for title, _ in parts if title]
+            self.send_gotify('\n\n'.join(message for _, message in parts), ', '.join(dict.fromkeys(titles)) or None)
+        elif backend == 'pushbullet':
+            for title, message in parts:
+                pushbullet_notify(message, title)
+        elif backend == 'pushover':
+            for title, message in parts:
+                pushover_notify(message, title)
+
+    def post(self, backend, url, **kwargs):
+        """POST with retries; honours 429 Retry-After / Telegram retry_after. Returns the response or None."""
+        for attempt in range(self.max_retries + 1):
+            delay = self.backoff * (2 ** attempt)
+            try:
+                resp = self.session(backend).post(url, timeout=30, **kwargs)
+            except requests.exceptions.RequestException as e:
+                print(f'{backend} notification attempt {attempt + 1} failed:\n{e}')
+            else:
+                if resp.status_code < 400:
+                    return resp
+                if resp.status_code == 429:
+                    delay = retry_after(resp, delay)
+                elif resp.status_code < 500:
+                    print(f'{backend} notification failed\n{resp.text}')
+                    return None
+            if attempt < self.max_retries:
+                time.sleep(delay)
+        print(f'{backend} notification failed after {self.max_retries + 1} attempts')
+        return None
+
+    def send_telegram(self, text, chat_id, token):
+        chat_id = chat_id or environ.get('NOTIFIERS_TELEGRAM_CHAT_ID')
+        token = token or environ.get('NOTIFIERS_TELEGRAM_TOKEN')
+        if not chat_id or not token:
+            print('Telegram notifications require NOTIFIERS_TELEGRAM_CHAT_ID'
+                  ' and NOTIFIERS_TELEGRAM_TOKEN environments to be exported.')
+            return
+        resp = self.post('telegram', f'https://api.telegram.org/bot{token}/sendMessage', json={
+            "chat_id": chat_id,
+            "text": text,
+            "parse_mode": "html",
+        })
+        if resp is not None:
+            print("Telegram notification sent successfully")
+
+    def send_gotify(self, message, title: str = None):
+        try:
+            host = environ['GOTIFY_HOST']
+            token = environ['GOTIFY_TOKEN']
+        except KeyError as e:
+            print(f'GOTIFY notifications require GOTIFY_HOST (base url with port),'
+                  f' GOTIFY_TOKEN to be exported. Detailed exception:\n{e}')
+            return
+
+        try:
+            prio = int(environ['GOTIFY_PRIORITY'])
+        except (KeyError, ValueError):
+            prio = 5
+
+        self.post('gotify', host + '/message', params={'token': token}, json={
+            "message": message,
+            "priority": prio,
+            "title": title or "medihunter",
+        })
+
+def retry_after(resp, default):
+    """Seconds to wait after a 429, from the Retry-After header or Telegram's retry_after field."""
+    try:
+        return float(resp.headers['Retry-After'])
+    except (KeyError, ValueError):
+        pass
+    try:
+        return float(resp.json()['parameters']['retry_after'])
+    except (ValueError, KeyError, TypeError):
+        return default
+
+def split_message(text, limit):
+    """Split text into chunks of at most limit characters, preferring line breaks."""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind('\n', 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip('\n')
+    if text:
+        chunks.append(text)
+    return chunks
@@ -0,0 +1,144 @@
+"""Per-stage timings and counters, exported as JSON lines and Prometheus text."""
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+PREFIX = "mediczuwacz"
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(q * len(values)))
+    return values[rank - 1]
+
+
+def label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Metrics:
+    """Thread-safe registry of stage durations and counters.
+
+    Recent durations are kept per (stage, labels) for the Prometheus summary.
+    With record_events set, every observation is also queued as a JSON line
+    until the next export.
+    """
+
+    def __init__(self, keep=1000):
+        self.keep = keep
+        self.record_events = False
+        self.lock = threading.Lock()
+        self.durations = {}
+        self.totals = {}
+        self.counters = {}
+        self.events = []
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, **labels)
+
+    def observe(self, stage, seconds, **labels):
+        key = (stage, label_key(labels))
+        with self.lock:
+            self.durations.setdefault(key, deque(maxlen=self.keep)).append(seconds)
+            count, total = self.totals.get(key, (0, 0.0))
+            self.totals[key] = (count + 1, total + seconds)
+            if self.record_events:
+                self.events.append({"ts": round(time.time(), 3), "stage": stage, "labels": labels, "seconds": round(seconds, 6)})
+
+    def count(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def write_jsonl(self, path):
+        """Append the observations recorded since the last export."""
+        with self.lock:
+            events, self.events = self.events, []
+        if not events:
+            return
+        with open(path, "a") as f:
+            for event in events:
+                f.write(json.dumps(event, separators=(",", ":")) + "\n")
+
+    def prometheus(self):
+        lines = []
+        with self.lock:
+            durations = {key: sorted(values) for key, values in self.durations.items()}
+            totals = dict(self.totals)
+            counters = dict(self.counters)
+
+        for stage in sorted({stage for stage, _ in durations}):
+            metric = f"{PREFIX}_{stage}_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for (name, labels), values in sorted(durations.items()):
+                if name != stage:
+                    continue
+                for q in QUANTILES:
+                    lines.append(f"{metric}{format_labels(labels + (('quantile', str(q)),))} {percentile(values, q):.6f}")
+                count, total = totals[(name, labels)]
+                lines.append(f"{metric}_sum{format_labels(labels)} {total:.6f}")
+                lines.append(f"{metric}_count{format_labels(labels)} {count}")
+
+        for name in sorted({name for name, _ in counters}):
+            metric = f"{PREFIX}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (counter, labels), value in sorted(counters.items()):
+                if counter == name:
+                    lines.append(f"{metric}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.prometheus())
+        os.replace(tmp_path, path)
+
+    def export(self, directory):
+        self.write_jsonl(os.path.join(directory, "metrics.jsonl"))
+        self.write_prometheus(os.path.join(directory, "metrics.prom"))
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (f'{k}="{v}"'.replace("\n", " ") for k, v in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+def summarize(path, since=None):
+    """Read a metrics.jsonl file and return [(stage, labels, count, p50, p90, p99, max)]."""
+    samples = {}
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if since and event["ts"] < since:
+                continue
+            key = (event["stage"], label_key(event.get("labels", {})))
+            samples.setdefault(key, []).append(event["seconds"])
+
+    rows = []
+    for (stage, labels), values in sorted(samples.items()):
+        values.sort()
+        rows.append((
+            stage, labels, len(values),
+            percentile(values, 0.5), percentile(values, 0.9), percentile(values, 0.99), values[-1],
+        ))
+    return rows
+
+
+metrics = Metrics()
@@ -0,0 +1,126 @@
+"""--profile: one command run under cProfile and tracemalloc, with reports kept on disk.
+
+Searches and notifications run on worker threads, so every thread started
+while profiling gets its own cProfile.Profile; the reports merge them all.
+Each run leaves three files named profile-<command>-<timestamp>:
+
+  .prof  raw cProfile data, loadable with pstats or snakeviz
+  .txt   hotspots by cumulative and own time, and the top allocation sites
+  .json  peak memory and allocation sites, used by compare()
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+
+class CycleProfiler:
+    def __init__(self, directory, command, frames=10):
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        self.base = os.path.join(directory, f"profile-{command}-{stamp}")
+        self.frames = frames
+        self.profile = cProfile.Profile()
+        self.thread_profiles = []
+        self.lock = threading.Lock()
+
+    def start_thread(self, frame, event, arg):
+        """threading.setprofile hook: hand the new thread over to a profiler of its own."""
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        with self.lock:
+            self.thread_profiles.append(profile)
+        profile.enable()
+
+    def start(self):
+        tracemalloc.start(self.frames)
+        threading.setprofile(self.start_thread)
+        self.profile.enable()
+
+    def stop(self):
+        """Stop profiling and write the reports; returns the path of the text report."""
+        self.profile.disable()
+        threading.setprofile(None)
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        stats = pstats.Stats(self.profile)
+        with self.lock:
+            for profile in self.thread_profiles:
+                profile.disable()
+                stats.add(profile)
+        stats.dump_stats(f"{self.base}.prof")
+
+        allocations = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*"),
+        )).statistics("lineno")[:TOP_ALLOCATIONS]
+
+        report = io.StringIO()
+        report.write(f"Peak traced memory: {peak / 1024:.1f} KiB, at exit: {current / 1024:.1f} KiB\n\n")
+        for order in ("cumulative", "tottime"):
+            stats.stream = report
+            stats.sort_stats(order).print_stats(TOP_FUNCTIONS)
+        report.write("Top allocation sites:\n")
+        for stat in allocations:
+            report.write(f"  {stat.size / 1024:10.1f} KiB {stat.count:8} blocks  {stat.traceback[0]}\n")
+        with open(f"{self.base}.txt", "w") as f:
+            f.write(report.getvalue())
+
+        with open(f"{self.base}.json", "w") as f:
+            json.dump({
+                "peak": peak,
+                "current": current,
+                "allocations": {str(stat.traceback[0]): stat.size for stat in allocations},
+            }, f, indent=2)
+        return f"{self.base}.txt"
+
+
+def function_times(path):
+    """{function label: (calls, own time, cumulative time)} from a .prof file."""
+    stats = pstats.Stats(path)
+    return {
+        pstats.func_std_string(func): (calls, tottime, cumtime)
+        for func, (_, calls, tottime, cumtime, _) in stats.stats.items()
+    }
+
+
+def compare(before, after, limit=25):
+    """Compare two saved profiles, given by any of their file names or the common prefix.
+
+    Returns (memory lines, [(function, calls before, calls after, cumtime before, cumtime after)])
+    sorted by the largest change in cumulative time.
+    """
+    before, after = (os.path.splitext(path)[0] if path.endswith((".prof", ".txt", ".json")) else path
+                     for path in (before, after))
+    old, new = function_times(f"{before}.prof"), function_times(f"{after}.prof")
+    rows = []
+    for func in set(old) | set(new):
+        old_calls, _, old_cum = old.get(func, (0, 0.0, 0.0))
+        new_calls, _, new_cum = new.get(func, (0, 0.0, 0.0))
+        rows.append((func, old_calls, new_calls, old_cum, new_cum))
+    rows.sort(key=lambda row: abs(row[4] - row[3]), reverse=True)
+
+    memory = []
+    if os.path.exists(f"{before}.json") and os.path.exists(f"{after}.json"):
+        with open(f"{before}.json") as f:
+            old_memory = json.load(f)
+        with open(f"{after}.json") as f:
+            new_memory = json.load(f)
+        memory.append(f"Peak memory: {old_memory['peak'] / 1024:.1f} KiB -> {new_memory['peak'] / 1024:.1f} KiB")
+        sites = set(old_memory["allocations"]) | set(new_memory["allocations"])
+        changes = sorted(
+            ((new_memory["allocations"].get(site, 0) - old_memory["allocations"].get(site, 0), site) for site in sites),
+            key=lambda change: abs(change[0]), reverse=True,
+        )
+        for delta, site in changes[:10]:
+            memory.append(f"  {delta / 1024:+10.1f} KiB  {site}")
+    return memory, rows[:limit]
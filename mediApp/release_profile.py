@@ -0,0 +1,103 @@
+"""When new slots tend to appear, learned from the first sighting of each slot.
+
+Every poll that finds slots a query did not have before counts as one release
+event in the 15-minute bucket of the local time of day, once for the specialty
+and once for every doctor involved. Buckets that hold a good share of the
+events become release windows that the scheduler polls more often.
+"""
+import json
+import os
+import time
+
+BUCKET = 15 * 60
+BUCKETS = 24 * 3600 // BUCKET
+
+
+def bucket_of(timestamp):
+    local = time.localtime(timestamp)
+    return (local.tm_hour * 3600 + local.tm_min * 60 + local.tm_sec) // BUCKET
+
+
+class ReleaseProfile:
+    """Release-time histograms per specialty and per doctor, plus the polling state of one-shot runs.
+
+    A doctor's own histogram is used once it holds `min_events` events, the
+    specialty's before that. A bucket is hot when it holds at least `share` of
+    the events; the bucket after it is polled as well, since slots are only
+    noticed at the next poll after they appear.
+    """
+
+    def __init__(self, path=None, min_events=3, share=0.15):
+        self.path = path
+        self.min_events = min_events
+        self.share = share
+        self.specialties = {}
+        self.doctors = {}
+        self.rows = {}
+        self.dirty = False
+        if path and os.path.exists(path) and os.path.getsize(path) > 0:
+            try:
+                with open(path, "r") as f:
+                    data = json.load(f)
+            except ValueError:
+                data = {}
+            self.specialties = data.get("specialties", {})
+            self.doctors = data.get("doctors", {})
+            self.rows = data.get("rows", {})
+
+    def record(self, specialty, doctor_ids, when=None):
+        """Count one release event for the specialty and for each doctor with new slots."""
+        bucket = bucket_of(when or time.time())
+        self.specialties.setdefault(str(specialty), [0] * BUCKETS)[bucket] += 1
+        for doctor in set(doctor_ids):
+            if doctor is not None:
+                self.doctors.setdefault(f"{specialty}|{doctor}", [0] * BUCKETS)[bucket] += 1
+        self.dirty = True
+
+    def histogram(self, specialty, doctor=None):
+        counts = self.doctors.get(f"{specialty}|{doctor}") if doctor is not None else None
+        if not counts or sum(counts) < self.min_events:
+            counts = self.specialties.get(str(specialty))
+        if not counts or sum(counts) < self.min_events:
+            return None
+        return counts
+
+    def hot_buckets(self, specialty, doctor=None):
+        counts = self.histogram(specialty, doctor)
+        if counts is None:
+            return set()
+        threshold = max(2, self.share * sum(counts))
+        hot = set()
+        for bucket, count in enumerate(counts):
+            if count >= threshold:
+                hot.add(bucket)
+                hot.add((bucket + 1) % BUCKETS)
+        return hot
+
+    def next_window(self, specialty, doctor=None, now=None):
+        """Return (start, end) timestamps of the current or next release window within a day, or None."""
+        hot = self.hot_buckets(specialty, doctor)
+        if not hot:
+            return None
+        now = now or time.time()
+        local = time.localtime(now)
+        bucket_start = now - (local.tm_min * 60 + local.tm_sec) % BUCKET - now % 1
+        current = bucket_of(now)
+        for offset in range(BUCKETS):
+            if (current + offset) % BUCKETS in hot:
+                start = bucket_start + offset * BUCKET
+                end = start + BUCKET
+                while (current + offset + 1) % BUCKETS in hot and end - start < 24 * 3600:
+                    offset += 1
+                    end += BUCKET
+                return max(start, now), end
+        return None
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"specialties": self.specialties, "doctors": self.doctors, "rows": self.rows}, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
@@ -0,0 +1,162 @@
+"""Reminder state for mediczuwacz.
+
+Reminder counts are kept in memory, indexed by (user, doctor_id) and then by
+appointmentDate, so checking a slot is a pair of dict lookups. Every change is
+appended to a JSON-lines log next to the snapshot; compact() folds the log back
+into the snapshot, which keeps the original doctor_data.json layout.
+
+Slots whose appointmentDate has passed are dropped automatically, and an
+optional max_per_key cap evicts the least recently seen slots of each
+(user, doctor_id) key.
+"""
+import datetime
+import json
+import os
+
+from metrics import metrics
+
+
+class ReminderStore:
+    def __init__(self, path, log_path=None, compact_every=500, max_per_key=None):
+        self.path = path
+        self.log_path = log_path or f"{os.path.splitext(path)[0]}.log"
+        self.compact_every = compact_every
+        self.max_per_key = max_per_key
+        self.index = {}
+        self.pending = 0
+        self.dirty = False
+        self._log = None
+        self.load()
+
+    @staticmethod
+    def split_key(key):
+        """Split a 'User_doctorId' snapshot key into (user, doctor_id)."""
+        user, _, doctor_id = key.rpartition("_")
+        return user, doctor_id
+
+    @staticmethod
+    def join_key(user, doctor_id):
+        return f"{user}_{doctor_id}"
+
+    def load(self):
+        """Import the JSON snapshot and replay the append-only log on top of it."""
+        with metrics.timer("reminders", op="load"):
+            self._load()
+
+    def _load(self):
+        self.index = {}
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with open(self.path, "r") as f:
+                snapshot = json.load(f)
+            for key, entries in snapshot.items():
+                key = self.split_key(key)
+                # Through apply() so that max_per_key also trims state saved without a cap
+                for entry in entries:
+                    self.apply(key, entry["appointmentDate"], entry["reminderCount"])
+
+        self.pending = 0
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Skip a torn last line
+                    self.apply(self.split_key(record["k"]), record["d"], record["c"])
+                    self.pending += 1
+
+        self.expire()
+
+    def apply(self, key, appointment_date, count):
+        dates = self.index.setdefault(key, {})
+        if self.max_per_key:
+            # Re-insert so the dict order doubles as the LRU order
+            dates.pop(appointment_date, None)
+            dates[appointment_date] = count
+            while len(dates) > self.max_per_key:
+                del dates[next(iter(dates))]
+                self.dirty = True
+        else:
+            dates[appointment_date] = count
+
+    def expire(self, now=None):
+        """Drop slots whose appointmentDate has already passed. Returns the number removed."""
+        now = now or datetime.datetime.now()
+        removed = 0
+        for key in list(self.index):
+            dates = self.index[key]
+            for date in [d for d in dates if self.is_past(d, now)]:
+                del dates[date]
+                removed += 1
+            if not dates:
+                del self.index[key]
+        if removed:
+            self.dirty = True
+        return removed
+
+    @staticmethod
+    def is_past(appointment_date, now):
+        try:
+            return datetime.datetime.fromisoformat(appointment_date) < now
+        except ValueError:
+            return False
+
+    def __len__(self):
+        return sum(len(dates) for dates in self.index.values())
+
+    def get(self, user, doctor_id, appointment_date):
+        return self.index.get((user, str(doctor_id)), {}).get(appointment_date, 0)
+
+    def bump(self, user, doctor_id, appointment_date):
+        """Increase the reminder count of a slot and return the new value."""
+        key = (user, str(doctor_id))
+        count = self.index.get(key, {}).get(appointment_date, 0) + 1
+        self.apply(key, appointment_date, count)
+        self.append_log(key, appointment_date, count)
+        return count
+
+    def append_log(self, key, appointment_date, count):
+        if self._log is None:
+            self._log = open(self.log_path, "a")
+        record = {"k": self.join_key(*key), "d": appointment_date, "c": count}
+        self._log.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.pending += 1
+
+    def flush(self):
+        """Flush the log and compact once it has grown past compact_every records."""
+        if self._log is not None:
+            with metrics.timer("reminders", op="flush"):
+                self._log.flush()
+        if self.pending >= self.compact_every:
+            self.compact()
+
+    def snapshot(self):
+        return {
+            self.join_key(*key): [
+                {"appointmentDate": date, "reminderCount": count}
+                for date, count in dates.items()
+            ]
+            for key, dates in self.index.items()
+            if dates
+        }
+
+    def compact(self):
+        """Expire past slots, write the in-memory state as a new snapshot and truncate the log."""
+        self.expire()
+        tmp_path = f"{self.path}.tmp"
+        with metrics.timer("reminders", op="save"):
+            with open(tmp_path, "w") as f:
+                json.dump(self.snapshot(), f, indent=4)
+            os.replace(tmp_path, self.path)
+
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self.pending = 0
+        self.dirty = False
+
+    def close(self):
+        if self._log is not None or self.pending or self.dirty:
+            self.compact()
@@ -0,0 +1,114 @@
+"""Per-row polling schedule for the daemon command."""
+import heapq
+import itertools
+import random
+import time
+
+
+class RowScheduler:
+    """Min-heap of next run times, one entry per watched row.
+
+    Entries are never removed from the heap in place; a popped entry that no
+    longer matches next_run[key] is simply skipped.
+
+    With max_interval set the schedule is adaptive: once a row has come back
+    unchanged `idle_runs` times in a row, its interval grows by `backoff` after
+    every further such run, up to max_interval, and drops back as soon as
+    something changes. Release windows pull runs in.
+    """
+
+    def __init__(self, default_interval, jitter=0.1, max_interval=None, backoff=2.0, hot_interval=120, idle_runs=4):
+        self.default_interval = default_interval
+        self.jitter = jitter
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.hot_interval = hot_interval
+        self.idle_runs = idle_runs
+        self.intervals = {}
+        self.idle = {}
+        self.next_run = {}
+        self.heap = []
+        self.counter = itertools.count()
+
+    def sync(self, intervals):
+        """Replace the set of rows, given as {key: interval in seconds or None}.
+
+        New rows are due immediately, rows that are kept keep their next run time.
+        """
+        for key in list(self.intervals):
+            if key not in intervals:
+                del self.intervals[key]
+                self.next_run.pop(key, None)
+                self.idle.pop(key, None)
+
+        now = time.time()
+        for key, interval in intervals.items():
+            self.intervals[key] = interval or self.default_interval
+            if key not in self.next_run:
+                self.schedule(key, now)
+
+    def schedule(self, key, when):
+        self.next_run[key] = when
+        heapq.heappush(self.heap, (when, next(self.counter), key))
+
+    def reschedule(self, key, now, changed=True, window=None):
+        """Schedule the next run of a row after a run at `now`.
+
+        `changed` is None when the run failed; the back-off then stays where it was.
+
+        `window` is the (start, end) of the row's current or next release window:
+        inside it the row is polled every hot_interval, and outside it the row
+        never sleeps past its start.
+        """
+        if key not in self.intervals:
+            return
+        interval = self.intervals[key]
+        if self.max_interval:
+            idle = self.idle.get(key, 0)
+            if changed is not None:
+                idle = 0 if changed else idle + 1
+            self.idle[key] = idle
+            if idle >= self.idle_runs:
+                steps = min(idle - self.idle_runs + 1, 16)
+                interval = min(interval * self.backoff ** steps, max(self.max_interval, interval))
+        delay = interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+        if window:
+            start, end = window
+            if start <= now < end:
+                delay = min(delay, self.hot_interval)
+            elif now < start < now + delay:
+                delay = start - now
+        self.schedule(key, now + delay)
+
+    def state(self):
+        """{key: {"next": timestamp, "idle": runs without changes}} for keeping the schedule between runs."""
+        return {key: {"next": when, "idle": self.idle.get(key, 0)} for key, when in self.next_run.items()}
+
+    def restore(self, state):
+        """Take over next run times and idle counts saved with state(), for rows that are still synced."""
+        for key, entry in state.items():
+            if key in self.intervals:
+                self.idle[key] = entry.get("idle", 0)
+                self.schedule(key, entry["next"])
+
+    def drop_stale(self):
+        while self.heap:
+            when, _, key = self.heap[0]
+            if self.next_run.get(key) == when:
+                return
+            heapq.heappop(self.heap)
+
+    def pop_due(self, now):
+        """Return the keys of all rows whose run time has come."""
+        due = []
+        self.drop_stale()
+        while self.heap and self.heap[0][0] <= now:
+            _, _, key = heapq.heappop(self.heap)
+            due.append(key)
+            self.drop_stale()
+        return due
+
+    def next_run_time(self):
+        self.drop_stale()
+        return self.heap[0][0] if self.heap else None
@@ -3,7 +3,7 @@ from setuptools import setup
 setup(
     name='mediczuwacz',
     version='0.5',
-    py_modules=['mediczuwacz'],
+    py_modules=['mediczuwacz', 'medihunter_notifiers', 'filters_cache', 'json_stream', 'metrics', 'profiling', 'release_profile', 'reminder_store', 'scheduler', 'slot_history', 'slots', 'snapshots', 'startup', 'transport', 'watchlist'],
     include_package_data=True,
     install_requires=[
         'fake-useragent',
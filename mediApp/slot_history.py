@@ -0,0 +1,134 @@
+"""SQLite archive of every slot the searches have seen.
+
+One row per (doctor, clinic, appointment time) with the time it was first and
+last seen, so questions like "how long do this doctor's slots stay open" or
+"which clinics publish the most slots" are answered by indexed SQL aggregates
+instead of loading the history into memory.
+"""
+import datetime
+import sqlite3
+import time
+
+from metrics import metrics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS slots (
+    doctor_id INTEGER NOT NULL,
+    clinic_id INTEGER NOT NULL,
+    appointment_at INTEGER NOT NULL,
+    specialty_id INTEGER NOT NULL,
+    first_seen INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL,
+    PRIMARY KEY (doctor_id, clinic_id, appointment_at)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS slots_by_specialty ON slots (specialty_id, first_seen, last_seen);
+CREATE INDEX IF NOT EXISTS slots_by_clinic ON slots (clinic_id, first_seen);
+CREATE TABLE IF NOT EXISTS names (
+    kind TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (kind, id)
+) WITHOUT ROWID;
+"""
+
+UPSERT = """
+INSERT INTO slots (doctor_id, clinic_id, appointment_at, specialty_id, first_seen, last_seen)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (doctor_id, clinic_id, appointment_at) DO UPDATE SET last_seen = excluded.last_seen
+"""
+
+# Appointment times are the clinic's wall-clock time, read in the local zone like release_profile
+# does, so appointment_at and first_seen are both real epochs and can be subtracted
+def epoch(when):
+    return int(when.timestamp())
+
+
+def utc_to_local_epoch(at):
+    return epoch(datetime.datetime.utcfromtimestamp(at))
+
+
+class SlotHistory:
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] < 1:
+            # Version 0 stored appointment times as if the clinic's wall-clock time were UTC
+            self.db.create_function("local_epoch", 1, utc_to_local_epoch)
+            with self.db:
+                self.db.execute("UPDATE OR IGNORE slots SET appointment_at = local_epoch(appointment_at)")
+                self.db.execute("PRAGMA user_version = 1")
+
+    def record(self, appointments, seen_at=None):
+        """Add new slots and move last_seen forward on known ones, in one transaction."""
+        seen_at = int(seen_at or time.time())
+        rows = {}
+        names = {}
+        for appointment in appointments:
+            doctor, clinic, specialty = appointment.doctor_id or 0, appointment.clinic_id or 0, appointment.specialty_id or 0
+            rows[(doctor, clinic, epoch(appointment.when))] = specialty
+            names[("doctor", doctor)] = appointment.doctor_name
+            names[("clinic", clinic)] = appointment.clinic_name
+            names[("specialty", specialty)] = appointment.specialty_name
+        if not rows:
+            return 0
+
+        with metrics.timer("history", op="record"), self.db:
+            self.db.executemany(
+                UPSERT, ((doctor, clinic, at, specialty, seen_at, seen_at) for (doctor, clinic, at), specialty in rows.items()),
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO names (kind, id, name) VALUES (?, ?, ?)",
+                ((kind, id_, name) for (kind, id_), name in names.items() if name != "N/A"),
+            )
+        return len(rows)
+
+    def query(self, group, specialty=None, doctor=None, clinic=None, days=None, limit=20):
+        """Aggregate the history per doctor, clinic or hour of first sighting.
+
+        Returns (column names, rows). Open time is last_seen - first_seen, so a
+        slot seen by a single search counts as open for 0 hours.
+        """
+        where, params = [], []
+        if specialty is not None:
+            where.append("s.specialty_id = ?")
+            params.append(specialty)
+        if doctor is not None:
+            where.append("s.doctor_id = ?")
+            params.append(doctor)
+        if clinic is not None:
+            where.append("s.clinic_id = ?")
+            params.append(clinic)
+        if days:
+            where.append("s.first_seen >= ?")
+            params.append(int(time.time() - days * 86400))
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+
+        if group == "hours":
+            sql = f"""
+                SELECT (s.first_seen % 86400) / 3600 AS hour_utc, COUNT(*) AS slots
+                FROM slots s {where_sql}
+                GROUP BY hour_utc ORDER BY hour_utc
+            """
+        else:
+            column = {"doctors": "doctor_id", "clinics": "clinic_id"}[group]
+            kind = group[:-1]
+            sql = f"""
+                SELECT s.{column} AS id, COALESCE(n.name, '') AS name, COUNT(*) AS slots,
+                       ROUND(AVG(s.last_seen - s.first_seen) / 3600.0, 1) AS avg_open_h,
+                       ROUND(MAX(s.last_seen - s.first_seen) / 3600.0, 1) AS max_open_h,
+                       ROUND(AVG(s.appointment_at - s.first_seen) / 86400.0, 1) AS avg_lead_days
+                FROM slots s LEFT JOIN names n ON n.kind = '{kind}' AND n.id = s.{column}
+                {where_sql}
+                GROUP BY s.{column} ORDER BY slots DESC LIMIT ?
+            """
+            params.append(limit)
+
+        with metrics.timer("history", op=group):
+            cursor = self.db.execute(sql, params)
+            return [d[0] for d in cursor.description], cursor.fetchall()
+
+    def close(self):
+        self.db.close()
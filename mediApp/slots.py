@@ -0,0 +1,125 @@
+"""Slot records and the single-pass stages that consume them.
+
+Every slot from a search-appointments/slots response is decoded once into an
+Appointment; the reminder filter, display and notifications all read its
+fields instead of walking and re-parsing the raw JSON.
+"""
+import datetime
+import sys
+from operator import attrgetter
+
+_languages = {}
+
+
+def _name(value):
+    return sys.intern(value) if isinstance(value, str) else "N/A"
+
+
+def _id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Appointment:
+    """One bookable slot.
+
+    Uses __slots__ and interned names: a watchlist can hold thousands of these,
+    and the same few clinic, doctor and specialty names repeat across all of them.
+    """
+
+    __slots__ = (
+        "when", "date_str", "doctor_id", "doctor_name", "clinic_id", "clinic_name",
+        "specialty_id", "specialty_name", "languages",
+    )
+
+    def __init__(self, when, date_str, doctor_id, doctor_name, clinic_id, clinic_name,
+                 specialty_id, specialty_name, languages=()):
+        self.when = when
+        self.date_str = date_str
+        self.doctor_id = doctor_id
+        self.doctor_name = doctor_name
+        self.clinic_id = clinic_id
+        self.clinic_name = clinic_name
+        self.specialty_id = specialty_id
+        self.specialty_name = specialty_name
+        self.languages = languages
+
+    @property
+    def key(self):
+        return f"{self.doctor_id}|{self.date_str}"
+
+    def __repr__(self):
+        return f"Appointment({self.date_str}, {self.doctor_name}, {self.clinic_name})"
+
+    def __eq__(self, other):
+        if not isinstance(other, Appointment):
+            return NotImplemented
+        return self.key == other.key and self.clinic_id == other.clinic_id
+
+    def __hash__(self):
+        return hash((self.key, self.clinic_id))
+
+    @classmethod
+    def from_json(cls, item):
+        """Build an Appointment from a decoded slot dict, or return None when its date is invalid."""
+        date_str = item.get("appointmentDate", "")
+        try:
+            when = datetime.datetime.fromisoformat(date_str)
+        except (TypeError, ValueError):
+            return None
+
+        doctor = item.get("doctor") or {}
+        clinic = item.get("clinic") or {}
+        specialty = item.get("specialty") or {}
+        languages = tuple(_name(lang.get("name")) for lang in item.get("doctorLanguages") or ())
+        return cls(
+            when=when,
+            date_str=date_str,
+            doctor_id=_id(doctor.get("id")),
+            doctor_name=_name(doctor.get("name")),
+            clinic_id=_id(clinic.get("id")),
+            clinic_name=_name(clinic.get("name")),
+            specialty_id=_id(specialty.get("id")),
+            specialty_name=_name(specialty.get("name")),
+            languages=_languages.setdefault(languages, languages),
+        )
+
+
+def slot_decoder():
+    """json object_hook that turns slot objects into Appointments while the response is decoded.
+
+    Slots with an invalid date become None; callers drop them.
+    """
+    def hook(obj):
+        if "appointmentDate" not in obj:
+            return obj
+        return Appointment.from_json(obj)
+    return hook
+
+
+def within_reminder_limit(appointments, reminders, user, limit=3):
+    """Bump the reminder count of each slot and yield those reminded at most `limit` times."""
+    for appointment in appointments:
+        if reminders.bump(user, appointment.doctor_id, appointment.date_str) <= limit:
+            yield appointment
+
+
+def window(appointments, end_date):
+    """Return (slots on or before end_date, whether any slot was after it)."""
+    if not end_date:
+        return appointments, False
+    kept = [appointment for appointment in appointments if appointment.when.date() <= end_date]
+    return kept, len(kept) < len(appointments)
+
+
+def group_by_day(appointments):
+    """Return [(date, [appointments])] sorted by date, each day in time order."""
+    grouped = {}
+    for appointment in appointments:
+        grouped.setdefault(appointment.when.date(), []).append(appointment)
+    for items in grouped.values():
+        # Pages arrive in time order already, so this is a linear pass
+        items.sort(key=attrgetter("when"))
+    return sorted(grouped.items())
@@ -0,0 +1,54 @@
+"""Change detection between consecutive search results of the same query."""
+import json
+import os
+from dataclasses import dataclass
+
+
+@dataclass
+class SlotDiff:
+    added: list
+    removed: list
+    persisted: int
+
+
+class SnapshotStore:
+    """Slot keys seen by the previous run of every query, kept in a JSON file between runs."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.snapshots = {}
+        self.dirty = False
+        if path and os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "r") as f:
+                self.snapshots = {key: set(slots) for key, slots in json.load(f).items()}
+
+    def diff(self, query_key, appointments):
+        """Compare appointments with the previous snapshot of query_key and store them as the new one.
+
+        Returns the added appointments, the keys of removed slots and the number of slots that stayed.
+        """
+        previous = self.snapshots.get(query_key, set())
+        current = set()
+        added = []
+        for appointment in appointments:
+            key = appointment.key
+            if key in current:
+                continue
+            current.add(key)
+            if key not in previous:
+                added.append(appointment)
+
+        # An empty result is stored too, so the key marks the query as searched before
+        if current != previous or query_key not in self.snapshots:
+            self.snapshots[query_key] = current
+            self.dirty = True
+        return SlotDiff(added, sorted(previous - current), len(current) - len(added))
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({key: sorted(slots) for key, slots in self.snapshots.items()}, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
@@ -0,0 +1,23 @@
+"""Deferred imports of heavy dependencies, with the time each one took."""
+import importlib
+import sys
+import time
+
+process_started = time.perf_counter()
+import_times = {}
+
+
+def lazy_import(name):
+    """Import a module on first use and remember how long it took."""
+    module = sys.modules.get(name)
+    if module is None:
+        started = time.perf_counter()
+        module = importlib.import_module(name)
+        import_times[name] = time.perf_counter() - started
+    return module
+
+
+def startup_report():
+    """Return (module, seconds) pairs for every deferred import, slowest first, plus the total run time."""
+    total = time.perf_counter() - process_started
+    return sorted(import_times.items(), key=lambda item: item[1], reverse=True), total
@@ -0,0 +1,313 @@
+"""HTTP transport for the Medicover login and API gateway hosts.
+
+Sessions get a tuned connection pool, default connect/read timeouts,
+compressed responses and retries with exponential backoff that honour
+Retry-After on 429 and 5xx responses. ConcurrencyGovernor adapts how many
+requests are in flight to how the gateway is coping.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from urllib.parse import urlencode
+
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
+
+from metrics import metrics
+
+MEDICOVER_HOSTS = (
+    "https://api-gateway-online24.medicover.pl",
+    "https://login-online24.medicover.pl",
+)
+DEFAULT_TIMEOUT = (5, 30)  # connect, read
+# gzip and deflate always; br only when a brotli package is installed for urllib3 to decode it
+ACCEPT_ENCODING = make_headers(accept_encoding=True)["accept-encoding"]
+
+
+class CappedRetry(Retry):
+    """Retry that never sleeps longer than RETRY_AFTER_MAX for a single Retry-After header."""
+
+    RETRY_AFTER_MAX = 60
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, self.RETRY_AFTER_MAX)
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default timeout to requests that do not set one."""
+
+    def __init__(self, *args, timeout=DEFAULT_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def configure_session(session, pool_size=16, retries=3, backoff=0.5, timeout=DEFAULT_TIMEOUT):
+    """Mount the tuned adapter on `session` for every Medicover host."""
+    retry = CappedRetry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        # Only GETs are replayed; login and token POSTs are not idempotent
+        allowed_methods=frozenset({"GET"}),
+        respect_retry_after_header=True,
+        # Hand the last error response back to the caller instead of raising
+        raise_on_status=False,
+    )
+    adapter = TimeoutHTTPAdapter(
+        pool_connections=len(MEDICOVER_HOSTS),
+        pool_maxsize=pool_size,
+        max_retries=retry,
+        timeout=timeout,
+    )
+    for host in MEDICOVER_HOSTS:
+        session.mount(host, adapter)
+    session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    session.headers["Connection"] = "keep-alive"
+    return session
+
+
+class RateLimiter:
+    """Spread calls so that at most `rate` of them start per second, across all threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_slot - now
+            self.next_slot = max(self.next_slot, now) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class CachedResponse:
+    __slots__ = ("etag", "last_modified", "digest", "data")
+
+    def __init__(self, etag, last_modified, digest, data):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest
+        self.data = data
+
+    def validators(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """Small LRU of decoded GET responses, keyed by URL and params.
+
+    A 304 answer, or a 200 whose body hashes the same as last time, returns the
+    previously decoded object and skips JSON decoding altogether.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.not_modified = 0
+        self.same_body = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(url, params):
+        return f"{url}?{urlencode(sorted((params or {}).items()), doseq=True)}"
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def hit_not_modified(self, entry):
+        with self.lock:
+            self.not_modified += 1
+        return entry.data
+
+    def decode(self, key, response, object_hook=None):
+        """Return the decoded body of a 200 response, reusing the cached object if the body did not change."""
+        digest = hashlib.blake2b(response.content, digest_size=16).digest()
+        cached = self.get(key)
+        if cached is not None and cached.digest == digest:
+            with self.lock:
+                cached.etag = response.headers.get("ETag") or cached.etag
+                cached.last_modified = response.headers.get("Last-Modified") or cached.last_modified
+                self.same_body += 1
+            return cached.data
+
+        data = response.json(object_hook=object_hook)
+        self.put(key, CachedResponse(
+            response.headers.get("ETag"), response.headers.get("Last-Modified"), digest, data,
+        ))
+        with self.lock:
+            self.misses += 1
+        return data
+
+    def stats(self):
+        hits = self.not_modified + self.same_body
+        total = hits + self.misses
+        return {
+            "hits": hits,
+            "not_modified": self.not_modified,
+            "same_body": self.same_body,
+            "misses": self.misses,
+            "hit_ratio": hits / total if total else 0.0,
+        }
+
+
+class CircuitOpen(RequestException):
+    """Raised instead of sending a request to an endpoint whose circuit breaker is open."""
+
+
+class EndpointHealth:
+    __slots__ = ("limit", "in_flight", "latencies", "failures", "open_until", "probing", "last_cut", "cuts", "trips")
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.in_flight = 0
+        self.latencies = deque(maxlen=window)
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.last_cut = 0.0
+        self.cuts = 0
+        self.trips = 0
+
+
+class ConcurrencyGovernor:
+    """AIMD limit on in-flight requests per endpoint, with a circuit breaker.
+
+    Every healthy response raises the endpoint's limit by 1/limit, so about one
+    more request is allowed per round of `limit` requests. A 429, a 5xx, a
+    connection error or a latency above `spike` times the rolling median halves
+    it, at most once per `cut_every` seconds so one burst of failures counts
+    once. After `failure_threshold` failures in a row the endpoint is paused
+    for `cooldown` seconds; then a single probe decides whether it reopens.
+    """
+
+    def __init__(self, initial=2, minimum=1, maximum=16, decrease=0.5, spike=3.0, window=50,
+                 failure_threshold=5, cooldown=30, cut_every=1.0):
+        self.initial = min(initial, maximum)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.spike = spike
+        self.window = window
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.cut_every = cut_every
+        self.endpoints = {}
+        self.changed = threading.Condition()
+
+    def health(self, endpoint):
+        state = self.endpoints.get(endpoint)
+        if state is None:
+            state = self.endpoints[endpoint] = EndpointHealth(self.initial, self.window)
+        return state
+
+    def acquire(self, endpoint):
+        """Wait for a free slot on `endpoint`; raise CircuitOpen while it is paused."""
+        with self.changed:
+            state = self.health(endpoint)
+            while True:
+                now = time.monotonic()
+                if state.open_until > now or state.probing:
+                    raise CircuitOpen(f"{endpoint} is paused after {state.failures} failed requests")
+                if state.open_until:
+                    # Cooldown is over: let exactly one request through to probe the endpoint
+                    state.probing = True
+                    break
+                if state.in_flight < int(state.limit):
+                    break
+                self.changed.wait()
+            state.in_flight += 1
+
+    def release(self, endpoint, latency, status=None):
+        """Report how a request went; status is None when it failed without a response."""
+        with self.changed:
+            state = self.health(endpoint)
+            state.in_flight -= 1
+            failed = status is None or status == 429 or status >= 500
+            ordered = sorted(state.latencies)
+            spiked = len(ordered) >= 10 and latency > self.spike * ordered[len(ordered) // 2]
+            if not failed:
+                state.latencies.append(latency)
+
+            if state.probing:
+                state.probing = False
+                state.open_until = 0.0 if not failed else time.monotonic() + self.cooldown
+
+            if failed:
+                state.failures += 1
+                if state.failures >= self.failure_threshold and not state.open_until:
+                    state.open_until = time.monotonic() + self.cooldown
+                    state.trips += 1
+                    metrics.count("circuit_open", endpoint=endpoint)
+            else:
+                state.failures = 0
+
+            if failed or spiked:
+                now = time.monotonic()
+                if now - state.last_cut >= self.cut_every:
+                    state.limit = max(self.minimum, state.limit * self.decrease)
+                    state.last_cut = now
+                    state.cuts += 1
+                    metrics.count("concurrency_cuts", endpoint=endpoint)
+            else:
+                state.limit = min(self.maximum, state.limit + 1 / state.limit)
+            self.changed.notify_all()
+
+    @contextmanager
+    def request(self, endpoint):
+        """Hold a slot for one request; the yielded list takes the response status."""
+        self.acquire(endpoint)
+        status = []
+        started = time.perf_counter()
+        try:
+            yield status
+        finally:
+            self.release(endpoint, time.perf_counter() - started, status[0] if status else None)
+
+    def stats(self):
+        with self.changed:
+            return {
+                endpoint: {
+                    "limit": round(state.limit, 1),
+                    "cuts": state.cuts,
+                    "trips": state.trips,
+                    "paused": state.open_until > time.monotonic(),
+                }
+                for endpoint, state in self.endpoints.items()
+            }
@@ -0,0 +1,108 @@
+"""Watchlist planning: turning params.csv searches into as few gateway requests as possible."""
+import functools
+from dataclasses import replace
+
+
+def group_key(query):
+    """Everything that shapes a slots request except the doctor."""
+    return (
+        query.region, query.specialty, query.search_type, query.start_date,
+        query.end_date, query.clinic, query.language,
+    )
+
+
+def coalesce_queries(queries):
+    """Merge queries that differ only by doctor into one request.
+
+    Returns a list of (request_query, member_indexes) pairs. The merged request
+    asks for all doctors of its members at once, or for every doctor when one
+    of the members has no doctor set.
+    """
+    groups = {}
+    for index, query in enumerate(queries):
+        groups.setdefault(group_key(query), []).append(index)
+
+    plan = []
+    for members in groups.values():
+        first = queries[members[0]]
+        if len(members) == 1:
+            plan.append((first, members))
+            continue
+        doctors = [queries[index].doctor for index in members]
+        doctor = None if None in doctors else tuple(sorted(set(doctors)))
+        plan.append((replace(first, doctor=doctor), members))
+    return plan
+
+
+def context_key(query):
+    """The parts of a query that the slots themselves cannot be checked against."""
+    return (query.region, query.search_type, query.start_date, query.end_date, query.language)
+
+
+class RuleIndex:
+    """params.csv rules compiled into nested dicts for routing slots.
+
+    Rules are keyed by (context, specialty), then by (doctor, clinic) with None
+    meaning any. A slot is matched with at most four lookups, so routing costs
+    grow with the number of slots and not with slots times rules.
+    """
+
+    def __init__(self, queries):
+        self.size = len(queries)
+        self.rules = {}
+        for index, query in enumerate(queries):
+            by_slot = self.rules.setdefault((context_key(query), query.specialty), {})
+            by_slot.setdefault((query.doctor, query.clinic), []).append(index)
+
+    @classmethod
+    @functools.lru_cache(maxsize=8)
+    def compile(cls, queries):
+        """Index for a tuple of queries, built once per distinct watchlist."""
+        return cls(queries)
+
+    def route(self, request, appointments, per_query):
+        """Append every slot of one response to the lists of all rules it matches."""
+        by_slot = self.rules.get((context_key(request), request.specialty))
+        if not by_slot:
+            return
+        for appointment in appointments:
+            doctor, clinic = appointment.doctor_id, appointment.clinic_id
+            for key in {(doctor, clinic), (doctor, None), (None, clinic), (None, None)}:
+                for index in by_slot.get(key, ()):
+                    per_query[index].append(appointment)
+
+    def route_all(self, plan, results):
+        """Split the responses of a request plan into per-query slot lists.
+
+        A None result marks a failed request: its member queries get None as well,
+        even if other requests returned some of their slots.
+        """
+        per_query = [[] for _ in range(self.size)]
+        failed = set()
+        for (request, members), appointments in zip(plan, results):
+            if appointments is None:
+                failed.update(members)
+                continue
+            self.route(request, appointments, per_query)
+        if len(plan) > 1:
+            # A slot fetched by two overlapping requests is only reported once
+            per_query = [list(dict.fromkeys(items)) for items in per_query]
+        for index in failed:
+            per_query[index] = None
+        return per_query
+
+
+def shard_queries(queries, shard_count):
+    """Split query indexes into shard_count lists, keeping queries that coalesce together."""
+    groups = {}
+    for index, query in enumerate(queries):
+        groups.setdefault(group_key(query), []).append(index)
+
+    shards = [[] for _ in range(shard_count)]
+    # Largest groups first, each to the shard with the fewest requests so far
+    loads = [0] * shard_count
+    for members in sorted(groups.values(), key=len, reverse=True):
+        target = loads.index(min(loads))
+        shards[target].extend(members)
+        loads[target] += 1
+    return shards